@@ -1,8 +1,13 @@
 import click
+import json
 import os
+import time
 from pathlib import Path
+from typing import Optional
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
 
-from config import root_folder, apply_configs
+from config import root_folder, apply_configs, load_services_config
 
 
 @click.group()
@@ -54,3 +59,48 @@ def build_docker_compose() -> None:
 def build(ctx: click.Context) -> None:
     build_config.invoke(ctx=ctx)
     build_docker_compose.invoke(ctx=ctx)
+
+
+@authorisation.command()
+@click.option("--url", default=None, help="Defaults to the service's external port.")
+@click.option("--limit", default=100, help="How many of the top paths to replay.")
+@click.option(
+    "--rate",
+    default=10.0,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Maximum requests per second.",
+)
+@click.option(
+    "--access-token",
+    required=True,
+    help="Token sent with each request, needs the meta.get scope.",
+)
+def warm_cache(url: Optional[str], limit: int, rate: float, access_token: str) -> None:
+    if url is None:
+        service = load_services_config()["authorisation"]
+        url = f"http://{service['host']}:{service['external_port']}"
+
+    headers = {"token": f"Bearer {access_token}"}
+
+    with urlopen(
+        Request(f"{url}/v0/meta/cache/popular?limit={limit}", headers=headers)
+    ) as response:
+        popular = json.loads(response.read())
+
+    print(f"Authorisation | warming {len(popular)} cached paths.")
+
+    warmed = 0
+    for entry in popular:
+        started = time.monotonic()
+
+        try:
+            with urlopen(Request(f"{url}{entry['path']}", headers=headers)):
+                warmed += 1
+        except HTTPError as error:
+            print(f"Authorisation | {entry['path']} returned {error.code}.")
+        except URLError as error:
+            print(f"Authorisation | {entry['path']} failed: {error.reason}")
+
+        time.sleep(max(0, 1 / rate - (time.monotonic() - started)))
+
+    print(f"Authorisation | warmed {warmed}/{len(popular)} cached paths.")
@@ -1,8 +1,22 @@
 import click
+import importlib.util
 import os
+import subprocess
 from pathlib import Path
+from types import ModuleType
 
-from config import root_folder, apply_configs
+from config import (
+    root_folder,
+    apply_configs,
+    load_db_config,
+    load_secrets_config,
+    load_services_config,
+)
+
+MIGRATIONS_TABLE = "public.schema_migrations"
+# Marks a migration that can't run inside a transaction, e.g. CREATE INDEX
+# CONCURRENTLY, which builds the index without blocking writes to the table.
+NO_TRANSACTION = "-- no-transaction"
 
 
 @click.group()
@@ -32,6 +46,30 @@ def build_patches() -> None:
             print(f"Postgres | {output_file} built.")
 
 
+def build_migrations_folder(migrations_folder: Path) -> None:
+    build_folder = migrations_folder / "build"
+    templates_folder = migrations_folder / "templates"
+
+    if not os.path.exists(build_folder):
+        os.makedirs(build_folder)
+
+    for file in sorted(os.listdir(templates_folder)):
+        output_file = str(file).replace(".template", "")
+        apply_configs(
+            input_path=templates_folder / file,
+            output_path=build_folder / output_file,
+            template_prefix="{",
+            template_suffix="}",
+        )
+        print(f"Postgres | {output_file} built.")
+
+
+@postgres.command()
+def build_migrations() -> None:
+    build_migrations_folder(root_folder / "services/postgres/migrations")
+    build_migrations_folder(root_folder / "services/postgres/migrations/optional")
+
+
 @postgres.command()
 def build_config() -> None:
     input_path = root_folder / "services/postgres/postgres.template.conf"
@@ -86,7 +124,219 @@ def build_dumps_folder() -> None:
 @click.pass_context
 def build(ctx: click.Context) -> None:
     build_patches.invoke(ctx=ctx)
+    build_migrations.invoke(ctx=ctx)
     build_config.invoke(ctx=ctx)
     build_docker_compose.invoke(ctx=ctx)
     build_data_folder.invoke(ctx=ctx)
     build_dumps_folder.invoke(ctx=ctx)
+
+
+def psql(sql: str) -> str:
+    result = subprocess.run(
+        [
+            "docker",
+            "exec",
+            "-i",
+            load_services_config()["postgres"]["name"],
+            "psql",
+            "--username",
+            load_secrets_config()["postgres"]["username"],
+            "--no-align",
+            "--tuples-only",
+            "--quiet",
+            "--set",
+            "ON_ERROR_STOP=1",
+        ],
+        input=sql,
+        capture_output=True,
+        text=True,
+    )
+
+    if result.returncode != 0:
+        raise click.ClickException(result.stderr.strip())
+
+    return result.stdout
+
+
+def load_module(path: Path) -> ModuleType:
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Each migration runs in its own transaction together with the insert into the
+# version table, so it is either applied and recorded or not at all. Optional
+# migrations are only applied when named, and are versioned apart from the rest.
+# Migrations marked no-transaction are recorded only once they have run, and
+# once no invalid index is left behind. A failed concurrent build leaves one,
+# which IF NOT EXISTS would otherwise skip over when the migration is retried.
+def apply_migrations(dry_run: bool, optional: tuple[str, ...] = ()) -> None:
+    psql(
+        f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+        + "version TEXT PRIMARY KEY, "
+        + "name TEXT NOT NULL, "
+        + "applied TIMESTAMP NOT NULL DEFAULT now());"
+    )
+    applied = set(psql(f"SELECT version FROM {MIGRATIONS_TABLE};").split())
+    migrations_folder = root_folder / "services/postgres/migrations"
+    migrations = [
+        (migrations_folder / "build" / file, file.split(".", 2)[0])
+        for file in sorted(os.listdir(migrations_folder / "build"))
+    ]
+    optional_folder = migrations_folder / "optional/build"
+    optional_files = {
+        file.split(".", 2)[1]: file for file in sorted(os.listdir(optional_folder))
+    }
+
+    for optional_name in optional:
+        if optional_name not in optional_files:
+            raise click.ClickException(f"Unknown optional migration: {optional_name}")
+
+        file = optional_files[optional_name]
+        migrations.append((optional_folder / file, "optional." + file.split(".", 2)[0]))
+
+    pending = 0
+
+    for path, version in migrations:
+        file = path.name
+        name = file.split(".", 2)[1]
+
+        if version in applied:
+            continue
+
+        pending += 1
+
+        if dry_run:
+            print(f"Postgres | {file} pending.")
+            continue
+
+        with open(path) as migration:
+            sql = migration.read()
+
+        record = (
+            f"INSERT INTO {MIGRATIONS_TABLE}(version, name) "
+            + f"VALUES ('{version}', '{name}');\n"
+        )
+
+        if NO_TRANSACTION in sql.splitlines():
+            psql(sql)
+
+            invalid = psql(
+                "SELECT indexrelid::regclass FROM pg_index WHERE NOT indisvalid;"
+            ).split()
+            if invalid:
+                raise click.ClickException(
+                    f"{file} left invalid indexes, drop them and migrate again: "
+                    + ", ".join(invalid)
+                )
+
+            psql(record)
+        else:
+            psql("BEGIN;\n" + sql + "\n" + record + "COMMIT;\n")
+        print(f"Postgres | {file} applied.")
+
+    if not pending:
+        print("Postgres | migrations up to date.")
+
+
+# With sequential scans disabled the planner falls back to walking a whole
+# index and filtering the rows, so an index scan only counts as using the index
+# if it has an Index Cond.
+def full_index_scans(plan: str) -> list[str]:
+    lines = plan.splitlines()
+    scans = []
+
+    for index, line in enumerate(lines):
+        if "Index Scan" not in line and "Index Only Scan" not in line:
+            continue
+
+        indent = len(line) - len(line.lstrip())
+        details = []
+        for detail in lines[index + 1 :]:
+            if detail.lstrip().startswith("->"):
+                break
+            if len(detail) - len(detail.lstrip()) <= indent:
+                break
+            details.append(detail)
+
+        if not any("Index Cond:" in detail for detail in details):
+            scans.append(line.strip().removeprefix("->").strip())
+
+    return scans
+
+
+# Plans are generic (parameters left unbound) and sequential scans are disabled,
+# so a statement passes if an index can serve it however small the table is.
+def explain_queries(schema: str, queries_folder: Path) -> bool:
+    query = load_module(root_folder / "shared/python/database/query.py")
+    passed = True
+
+    for path in sorted(queries_folder.glob("*.py")):
+        module = load_module(path)
+
+        for name, template in vars(module).items():
+            if not name.isupper() or not isinstance(template, str):
+                continue
+
+            if "{where}" in template:
+                statements = [
+                    query.compile_query(template, where=where).sql
+                    for where in getattr(module, f"{name}_WHERE", [])
+                ]
+            else:
+                statements = [query.compile_query(template).sql]
+
+            for statement in statements:
+                try:
+                    plan = psql(
+                        f"SET search_path TO {schema};\n"
+                        + "SET enable_seqscan = off;\n"
+                        + f"EXPLAIN (GENERIC_PLAN) {statement};"
+                    )
+                except click.ClickException as error:
+                    passed = False
+                    print(f"Postgres | {path.stem}.{name} could not be explained.")
+                    print(error.message)
+                    continue
+
+                if "Seq Scan" in plan:
+                    passed = False
+                    print(f"Postgres | {path.stem}.{name} uses a sequential scan.")
+                    print(" ".join(statement.split()))
+                    print(plan)
+                elif full_index_scans(plan=plan):
+                    passed = False
+                    print(f"Postgres | {path.stem}.{name} scans a whole index.")
+                    print(" ".join(statement.split()))
+                    print(plan)
+                else:
+                    print(f"Postgres | {path.stem}.{name} uses an index.")
+
+    return passed
+
+
+@postgres.command()
+@click.option("--dry-run", is_flag=True, help="List pending migrations only.")
+@click.option(
+    "--optional",
+    multiple=True,
+    help="Also apply the named optional migration.",
+)
+@click.option(
+    "--explain",
+    is_flag=True,
+    help="Check every authorisation store query can use an index.",
+)
+@click.pass_context
+def migrate(
+    ctx: click.Context, dry_run: bool, optional: tuple[str, ...], explain: bool
+) -> None:
+    ctx.invoke(build_migrations)
+    apply_migrations(dry_run=dry_run, optional=optional)
+
+    if explain and not explain_queries(
+        schema=load_db_config()["schema"]["authorisation"]["name"],
+        queries_folder=root_folder / "services/authorisation/api/stores/queries",
+    ):
+        raise click.ClickException("Some queries do not use an index.")
@@ -2,6 +2,8 @@ from typing import Optional
 from fastapi import Depends, HTTPException, Query, Request
 
 from auth.jwt_bearer import JWTBearer
+from cache import cache
+from database import database
 from stores.users import UsersStore
 from stores.sessions import SessionsStore
 from shared.python.models.authorisation import UserCredentials
@@ -23,7 +25,13 @@ class BearerUser(JWTBearer):
             access_token=access_token,
             sessions_store=sessions_store,
         )
-        user = await users_store.get_user(id=jwt_bearer.session.user_id)
+        user = await users_store.get_user(
+            id=jwt_bearer.session.user_id,
+            primary=bool(database.replicas)
+            and await cache.recently_invalidated(
+                tag=f"user:{jwt_bearer.session.user_id}"
+            ),
+        )
 
         if user is None:
             raise HTTPException(status_code=401, detail="Invalid session user")
@@ -4,6 +4,8 @@ from fastapi import Depends, Query, Request, HTTPException
 
 from shared.python.config.auth import AUTH_NAME, AUTH_SCHEME
 from auth.jwt import decode_jwt
+from cache import cache
+from database import database
 from stores.sessions import SessionsStore
 from shared.python.models.authorisation import JWTAuthorizationCredentials
 
@@ -121,6 +123,14 @@ class JWTBearer:
 
         session = await sessions_store.get_session(id=session_id)
 
+        # A session created moments ago may not have reached the replicas yet,
+        # and one just disabled may still look active there.
+        if session is None or (
+            database.replicas
+            and await cache.recently_invalidated(tag=f"session:{session_id}")
+        ):
+            session = await sessions_store.get_session(id=session_id, primary=True)
+
         if session is None:
             request.app.logger.error("Session not found in db on protected route.")
             raise AuthorisationException(
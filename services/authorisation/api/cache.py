@@ -1,9 +1,41 @@
 from app_config import config
 
 from shared.python.cache import Cache
+from shared.python.cache.breaker import CircuitBreaker
+from shared.python.cache.codec import Codec
+from shared.python.cache.local import LocalCache
+from shared.python.cache.popularity import PopularitySketch
 
 cache = Cache(
     host=config["cache"]["host"],
     port=config["cache"]["port"],
     alias=config["cache"].get("alias"),
+    replicas=config["cache"].get("replicas"),
+    sentinels=config["cache"].get("sentinels"),
+    sentinel_service=config["cache"].get("sentinel_service", "mymaster"),
+    sentinel_read_replicas=config["cache"].get("sentinel_read_replicas", False),
+    shards=config["cache"].get("shards"),
+    route_query_hash_length=config["cache"].get("route_query_hash_length"),
+    invalidation_window=config["cache"].get("invalidation_window", 5),
+    **config["cache"].get("pool", {}),
+    breaker=(
+        CircuitBreaker(**config["cache"]["breaker"])
+        if config["cache"].get("breaker") is not None
+        else None
+    ),
+    local=(
+        LocalCache(**config["cache"]["local"])
+        if config["cache"].get("local") is not None
+        else None
+    ),
+    codec=(
+        Codec(**config["cache"]["codec"])
+        if config["cache"].get("codec") is not None
+        else None
+    ),
+    popularity=(
+        PopularitySketch(**config["cache"]["popularity"])
+        if config["cache"].get("popularity") is not None
+        else None
+    ),
 )
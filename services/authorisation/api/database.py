@@ -8,4 +8,8 @@ database = Database(
     user=config["db"]["user"],
     password=config["db"]["password"],
     name=config["db"].get("name"),
+    replicas=config["db"].get("replicas"),
+    slow_query_threshold=config["db"].get("slow_query_threshold"),
+    explain_slow_queries=config["db"].get("explain_slow_queries", False),
+    **config["db"].get("pool", {}),
 )
@@ -1,8 +1,11 @@
+from fastapi import Depends
 from passlib.context import CryptContext
 
 from app_config import config
+from auth.bearer_permission import BearerPermission
 from cache import cache
 from database import database
+from pruner import session_pruner
 from routes.login import LOGIN_V0_ROUTER
 from routes.sessions import SESSIONS_V0_ROUTER
 from routes.users import USERS_V0_ROUTER
@@ -10,6 +13,7 @@ from stores.sessions import sessions_store
 from stores.users import users_store
 
 from shared.python.speedyapi import SpeedyAPI
+from shared.python.speedyapi.routes.meta import META_STATS_ROUTER
 
 app = SpeedyAPI()
 app.config = config
@@ -17,6 +21,7 @@ app.password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 app.db = database
 app.cache = cache
+app.session_pruner = session_pruner
 
 app.sessions_store = sessions_store
 app.users_store = users_store
@@ -25,11 +30,22 @@ app.users_store.password_context = app.password_context
 app.include_router(LOGIN_V0_ROUTER)
 app.include_router(SESSIONS_V0_ROUTER)
 app.include_router(USERS_V0_ROUTER)
+app.include_router(
+    META_STATS_ROUTER, dependencies=[Depends(BearerPermission(scope="meta.get"))]
+)
 
 
 @app.on_event("startup")  # type: ignore
 async def startup() -> None:
     app.db.logger = app.logger
     app.cache.logger = app.logger
+    app.session_pruner.logger = app.logger
     await app.db.initialise()
     await app.cache.initialise()
+    app.session_pruner.start()
+
+
+@app.on_event("shutdown")  # type: ignore
+async def shutdown() -> None:
+    await app.session_pruner.stop()
+    await app.db.close()
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app_config import config
+from stores.sessions import SessionsStore, sessions_store
+
+from shared.python.speedyapi import Logger
+
+
+class SessionPruner:
+    store: SessionsStore
+    interval: float
+    batch_size: int
+    batch_delay: float
+    retention: timedelta
+    archive: bool
+    partitioned: bool
+    partitions_ahead: int
+    logger: Logger
+    task: Optional[asyncio.Task]
+
+    def __init__(
+        self,
+        store: SessionsStore,
+        interval: float = 300,
+        batch_size: int = 1000,
+        batch_delay: float = 0.1,
+        retention: float = 86400,
+        archive: bool = False,
+        partitioned: bool = False,
+        partitions_ahead: int = 7,
+        logger: Optional[Logger] = None,
+    ) -> None:
+        self.store = store
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.retention = timedelta(seconds=retention)
+        self.archive = archive
+        self.partitioned = partitioned
+        self.partitions_ahead = partitions_ahead
+        self.logger = logger or logging.getLogger()
+        self.task = None
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self._prune())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _prune(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.prune()
+
+    async def prune(self) -> int:
+        before = datetime.utcnow() - self.retention
+        pruned = 0
+
+        # Partition upkeep fails on its own, so a problem there (say partitioned
+        # is set before the partition migration ran) never stops row pruning.
+        if self.partitioned:
+            await self._create_partitions()
+        # Without archiving whole days can be dropped up front, leaving only
+        # the partial day to delete row by row.
+        if self.partitioned and not self.archive:
+            await self._drop_partitions(before=before)
+
+        try:
+            pruned = await self._prune_batches(before=before)
+        except Exception as error:
+            self.logger.error(f"Errored when pruning sessions: {error}")
+        else:
+            # Archived days are only dropped once every row in them was moved.
+            if self.partitioned and self.archive:
+                await self._drop_partitions(before=before)
+
+        if pruned:
+            self.logger.info(f"Pruned {pruned} expired sessions.")
+
+        return pruned
+
+    # Small batches keep each delete's locks and WAL short, and the delay
+    # between them leaves room for the request traffic on the same pool.
+    async def _prune_batches(self, before: datetime) -> int:
+        pruned = 0
+
+        while True:
+            count = await self.store.prune_sessions(
+                before=before, limit=self.batch_size, archive=self.archive
+            )
+            pruned += count
+
+            if count < self.batch_size:
+                return pruned
+
+            await asyncio.sleep(self.batch_delay)
+
+    async def _create_partitions(self) -> None:
+        try:
+            await self.store.create_session_partitions(
+                start=datetime.utcnow().date(), days=self.partitions_ahead + 1
+            )
+        except Exception as error:
+            self.logger.error(f"Errored when creating sessions partitions: {error}")
+
+    async def _drop_partitions(self, before: datetime) -> None:
+        try:
+            for name in await self.store.drop_session_partitions(before=before.date()):
+                self.logger.info(f"Dropped expired sessions partition {name}.")
+        except Exception as error:
+            self.logger.error(f"Errored when dropping sessions partitions: {error}")
+
+
+session_pruner = SessionPruner(
+    store=sessions_store, **config.get("session_pruning", {})
+)
@@ -45,7 +45,7 @@ async def login(
         raise HTTPException(status_code=401, detail="Log in failed.")
 
     old_sessions = await sessions_store.get_sessions(
-        expires_gte=datetime.utcnow(), user_id=user.id, disabled=False
+        expires_gte=datetime.utcnow(), user_id=user.id, disabled=False, primary=True
     )
     for session in old_sessions:
         await sessions_store.update_session(
@@ -82,11 +82,12 @@ async def login(
     )
     response.headers.append(key=AUTH_NAME, value=f"{AUTH_SCHEME} {jwt_token}")
 
-    await cache.clear(
-        key=cache.create_route_key(request=request, include_query_params=False).replace(
-            "/logout", "/token"
-        )
-        + f"?access_token={jwt_token}"
+    await cache.invalidate_tags(
+        tags=[
+            "sessions",
+            f"session:{session.id}",
+            *[f"session:{old_session.id}" for old_session in old_sessions],
+        ]
     )
 
     return LoginResponse(
@@ -118,11 +119,8 @@ async def logout(
             disabled=True,
         )
     )
-    await cache.clear(
-        key=cache.create_route_key(request=request, include_query_params=False).replace(
-            "/logout", "/token"
-        )
-        + f"?access_token={user_credentials.token}"
+    await cache.invalidate_tags(
+        tags=["sessions", f"session:{user_credentials.session.id}"]
     )
 
     if not session:
@@ -133,7 +131,15 @@ async def logout(
 
 
 @LOGIN_V0_ROUTER.get("/token", response_model=UserCredentials)
-@cache.route(expiry=10, include_access_token=True)
+@cache.route(
+    expiry=10,
+    include_access_token=True,
+    raw=True,
+    value_tags=lambda credentials: [
+        f"session:{credentials.session.id}",
+        f"user:{credentials.user.id}",
+    ],
+)
 async def check_token(
     user_credentials: UserCredentials = Depends(BearerUser()),
 ) -> UserCredentials:
@@ -1,10 +1,25 @@
-from typing import Optional
+from datetime import datetime
+from typing import Optional, Union
 from fastapi import HTTPException, Query, Depends, Request
+from fastapi.responses import StreamingResponse
 
 from cache import cache
 from auth.bearer_permission import BearerPermission, PermissionCredentials
 from stores.sessions import SessionsStore, sessions_store
+from shared.python.database.query import Keyset
 from shared.python.speedyapi import APIRouter
+from shared.python.speedyapi.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    to_page,
+)
+from shared.python.speedyapi.responses import (
+    stream_response,
+    wants_ndjson,
+    wants_stream,
+)
+from shared.python.models.pagination import Page
 from shared.python.cache import Cache
 from shared.python.models.session import Session, CreateSession
 
@@ -13,7 +28,7 @@ SESSIONS_V0_ROUTER = APIRouter(prefix="/v0/sessions", tags=["sessions"])
 
 
 @SESSIONS_V0_ROUTER.get("/{id:int}", response_model=Session)
-@cache.route(expiry=60)
+@cache.route(expiry=60, tags=["session:{id}"], raw=True, negative_expiry=10)
 async def get_session(
     id: int,
     sessions_store: SessionsStore = Depends(sessions_store),
@@ -21,7 +36,7 @@ async def get_session(
         BearerPermission(scope="sessions.get")
     ),
 ) -> Session:
-    session = await sessions_store.get_session(id=id)
+    session = await sessions_store.get_session(id=id, primary=True)
 
     if session is None:
         raise HTTPException(status_code=404, detail="Session not found.")
@@ -29,29 +44,54 @@ async def get_session(
     return session
 
 
-@SESSIONS_V0_ROUTER.get("/", response_model=list[Session])
-@cache.route(expiry=60)
+@SESSIONS_V0_ROUTER.get("/", response_model=Page[Session])
+@cache.route(
+    expiry=60,
+    stale_ttl=30,
+    tags=["sessions"],
+    lock_lease=5,
+    raw=True,
+    bypass=wants_stream,
+)
 async def get_sessions(
+    request: Request,
     id: Optional[list[int]] = Query(default=None),
     user_id: Optional[list[int]] = Query(default=None),
     ip: Optional[list[str]] = Query(default=None),
+    cursor: Optional[str] = Query(default=None),
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = Query(default=False),
     sessions_store: SessionsStore = Depends(sessions_store),
     permissions: PermissionCredentials = Depends(
         BearerPermission(scope="sessions.get")
     ),
-) -> Session:
-    session = await sessions_store.get_sessions(id=id, user_id=user_id, ip=ip)
-
-    if session is None:
-        raise HTTPException(status_code=404, detail="Session not found.")
+) -> Union[Page[Session], StreamingResponse]:
+    after = decode_cursor(cursor=cursor, sort_type=datetime.fromisoformat)
+
+    if stream or wants_ndjson(request):
+        return stream_response(
+            request=request,
+            content=sessions_store.stream_sessions(
+                id=id, user_id=user_id, ip=ip, after=after, limit=limit
+            ),
+        )
+
+    limit = limit or DEFAULT_PAGE_SIZE
+    sessions = await sessions_store.get_sessions(
+        id=id, user_id=user_id, ip=ip, after=after, limit=limit + 1, primary=True
+    )
 
-    return session
+    return to_page(
+        request=request,
+        items=sessions,
+        limit=limit,
+        keyset=lambda session: Keyset(sort_key=session.created, id=session.id),
+    )
 
 
 @SESSIONS_V0_ROUTER.post("/", response_model=Session)
 async def create_session(
     session: CreateSession,
-    request: Request,
     sessions_store: SessionsStore = Depends(sessions_store),
     cache: Cache = Depends(cache),
     permissions: PermissionCredentials = Depends(
@@ -63,10 +103,7 @@ async def create_session(
     if session is None:
         raise HTTPException(status_code=404, detail="Session not found.")
 
-    await cache.clear_pattern(
-        pattern=cache.create_route_key(request=request, include_query_params=False)
-        + "*"
-    )
+    await cache.invalidate_tags(tags=["sessions", f"session:{session.id}"])
 
     return session
 
@@ -75,7 +112,6 @@ async def create_session(
 async def update_session(
     id: int,
     session: Session,
-    request: Request,
     sessions_store: SessionsStore = Depends(sessions_store),
     cache: Cache = Depends(cache),
     permissions: PermissionCredentials = Depends(
@@ -87,10 +123,7 @@ async def update_session(
     if session is None:
         raise HTTPException(status_code=404, detail="Session not found.")
 
-    await cache.clear_pattern(
-        pattern=cache.create_route_key(request=request, include_query_params=False)
-        + "*"
-    )
+    await cache.invalidate_tags(tags=["sessions", f"session:{id}"])
 
     return session
 
@@ -98,7 +131,6 @@ async def update_session(
 @SESSIONS_V0_ROUTER.delete("/{id:int}")
 async def delete_session(
     id: int,
-    request: Request,
     sessions_store: SessionsStore = Depends(sessions_store),
     cache: Cache = Depends(cache),
     permissions: PermissionCredentials = Depends(
@@ -107,9 +139,6 @@ async def delete_session(
 ) -> None:
     await sessions_store.delete_session(id=id)
 
-    await cache.clear_pattern(
-        pattern=cache.create_route_key(request=request, include_query_params=False)
-        + "*"
-    )
+    await cache.invalidate_tags(tags=["sessions", f"session:{id}"])
 
     return None
@@ -1,11 +1,25 @@
-from typing import Optional
+from typing import Optional, Union
 from fastapi import HTTPException, Query, Depends, Request
+from fastapi.responses import StreamingResponse
 
 from cache import cache
 from auth.bearer_permission import BearerPermission, PermissionCredentials
 from shared.python.cache import Cache
 from stores.users import UsersStore, users_store
+from shared.python.database.query import Keyset
 from shared.python.speedyapi import APIRouter
+from shared.python.speedyapi.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    to_page,
+)
+from shared.python.speedyapi.responses import (
+    stream_response,
+    wants_ndjson,
+    wants_stream,
+)
+from shared.python.models.pagination import Page
 from shared.python.models.user import User, CreateUser, UserNoPassword
 
 
@@ -13,13 +27,13 @@ USERS_V0_ROUTER = APIRouter(prefix="/v0/users", tags=["users"])
 
 
 @USERS_V0_ROUTER.get("/{id:int}", response_model=UserNoPassword)
-@cache.route(expiry=60)
+@cache.route(expiry=60, tags=["user:{id}"], raw=True, negative_expiry=10)
 async def get_user(
     id: int,
     users_store: UsersStore = Depends(users_store),
     permissions: PermissionCredentials = Depends(BearerPermission(scope="users.get")),
 ) -> UserNoPassword:
-    user = await users_store.get_user(id=id)
+    user = await users_store.get_user(id=id, primary=True)
 
     if user is None:
         raise HTTPException(status_code=404, detail="User not found.")
@@ -41,13 +55,19 @@ async def get_self(
 
 
 @USERS_V0_ROUTER.get("/{username:str}", response_model=UserNoPassword)
-@cache.route(expiry=60)
+@cache.route(
+    expiry=60,
+    tags=["username:{username}"],
+    value_tags=lambda user: [f"user:{user.id}"],
+    raw=True,
+    negative_expiry=10,
+)
 async def get_user_by_username(
     username: str,
     users_store: UsersStore = Depends(users_store),
     permissions: PermissionCredentials = Depends(BearerPermission(scope="users.get")),
 ) -> UserNoPassword:
-    user = await users_store.get_user_by_username(username=username)
+    user = await users_store.get_user_by_username(username=username, primary=True)
 
     if user is None:
         raise HTTPException(status_code=404, detail="User not found.")
@@ -55,27 +75,67 @@ async def get_user_by_username(
     return UserNoPassword.parse_obj(dict(user))
 
 
-@USERS_V0_ROUTER.get("/", response_model=list[UserNoPassword])
-@cache.route(expiry=60)
+@USERS_V0_ROUTER.get("/", response_model=Page[UserNoPassword])
+@cache.route(
+    expiry=60,
+    stale_ttl=30,
+    tags=["users"],
+    lock_lease=5,
+    raw=True,
+    bypass=wants_stream,
+)
 async def get_users(
+    request: Request,
     id: Optional[list[int]] = Query(default=None),
     username: Optional[list[str]] = Query(default=None),
     name: Optional[list[str]] = Query(default=None),
     scopes: Optional[list[str]] = Query(default=None),
+    cursor: Optional[str] = Query(default=None),
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = Query(default=False),
     users_store: UsersStore = Depends(users_store),
     permissions: PermissionCredentials = Depends(BearerPermission(scope="users.get")),
-) -> list[UserNoPassword]:
+) -> Union[Page[UserNoPassword], StreamingResponse]:
+    after = decode_cursor(cursor=cursor)
+
+    if stream or wants_ndjson(request):
+        return stream_response(
+            request=request,
+            content=(
+                UserNoPassword.parse_obj(dict(user))
+                async for user in users_store.stream_users(
+                    id=id,
+                    username=username,
+                    name=name,
+                    scopes=scopes,
+                    after=after,
+                    limit=limit,
+                )
+            ),
+        )
+
+    limit = limit or DEFAULT_PAGE_SIZE
     users = await users_store.get_users(
-        id=id, username=username, name=name, scopes=scopes
+        id=id,
+        username=username,
+        name=name,
+        scopes=scopes,
+        after=after,
+        limit=limit + 1,
+        primary=True,
     )
 
-    return [UserNoPassword.parse_obj(dict(user)) for user in users]
+    return to_page(
+        request=request,
+        items=[UserNoPassword.parse_obj(dict(user)) for user in users],
+        limit=limit,
+        keyset=lambda user: Keyset(sort_key=user.id, id=user.id),
+    )
 
 
 @USERS_V0_ROUTER.post("/", response_model=UserNoPassword)
 async def create_user(
     user: CreateUser,
-    request: Request,
     users_store: UsersStore = Depends(users_store),
     cache: Cache = Depends(cache),
     permissions: PermissionCredentials = Depends(
@@ -87,9 +147,8 @@ async def create_user(
     if user is None:
         raise HTTPException(status_code=404, detail="User not found.")
 
-    await cache.clear_pattern(
-        pattern=cache.create_route_key(request=request, include_query_params=False)
-        + "*"
+    await cache.invalidate_tags(
+        tags=["users", f"user:{user.id}", f"username:{user.username}"]
     )
 
     return UserNoPassword.parse_obj(dict(user))
@@ -99,7 +158,6 @@ async def create_user(
 async def update_user(
     id: int,
     user: UserNoPassword,
-    request: Request,
     users_store: UsersStore = Depends(users_store),
     cache: Cache = Depends(cache),
     permissions: PermissionCredentials = Depends(
@@ -111,9 +169,8 @@ async def update_user(
     if user is None:
         raise HTTPException(status_code=404, detail="User not found.")
 
-    await cache.clear_pattern(
-        pattern=cache.create_route_key(request=request, include_query_params=False)
-        + "*"
+    await cache.invalidate_tags(
+        tags=["users", f"user:{id}", f"username:{user.username}"]
     )
 
     return UserNoPassword.parse_obj(dict(user))
@@ -123,7 +180,6 @@ async def update_user(
 async def update_user_password(
     id: int,
     user: User,
-    request: Request,
     users_store: UsersStore = Depends(users_store),
     cache: Cache = Depends(cache),
     permissions: PermissionCredentials = Depends(
@@ -135,9 +191,8 @@ async def update_user_password(
     if user is None:
         raise HTTPException(status_code=404, detail="User not found.")
 
-    await cache.clear_pattern(
-        pattern=cache.create_route_key(request=request, include_query_params=False)
-        + "*"
+    await cache.invalidate_tags(
+        tags=["users", f"user:{id}", f"username:{user.username}"]
     )
 
     return UserNoPassword.parse_obj(dict(user))
@@ -146,7 +201,6 @@ async def update_user_password(
 @USERS_V0_ROUTER.delete("/{id:int}")
 async def delete_user(
     id: int,
-    request: Request,
     users_store: UsersStore = Depends(users_store),
     cache: Cache = Depends(cache),
     permissions: PermissionCredentials = Depends(
@@ -155,9 +209,6 @@ async def delete_user(
 ) -> None:
     await users_store.delete_user(id=id)
 
-    await cache.clear_pattern(
-        pattern=cache.create_route_key(request=request, include_query_params=False)
-        + "*"
-    )
+    await cache.invalidate_tags(tags=["users", f"user:{id}"])
 
     return None
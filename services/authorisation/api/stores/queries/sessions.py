@@ -8,8 +8,20 @@ GET_SESSIONS = """
 SELECT id, user_id, expires, created, ip, disabled
 FROM sessions
 WHERE {where}
+ORDER BY created, id
+LIMIT {limit}
 """
 
+# Representative filters for GET_SESSIONS, checked against the indexes by
+# `services postgres migrate --explain`.
+GET_SESSIONS_WHERE = [
+    "id = ANY({id})",
+    "user_id = ANY({user_id})",
+    "ip = ANY({ip})",
+    "user_id = ANY({user_id}) AND NOT disabled AND expires >= {expires_gte}",
+    "(created, id) > ({after_sort_key}, {after_id})",
+]
+
 CREATE_SESSION = """
 INSERT INTO sessions(user_id, created, expires, ip, disabled)
 VALUES ({user_id}, {created}, {expires}, {ip}, {disabled})
@@ -26,3 +38,40 @@ DELETE_SESSION = """
 DELETE FROM sessions
 WHERE id = {id}
 """
+
+# Expired sessions are pruned in batches, skipping rows locked by a concurrent
+# update so pruning never waits on (or blocks) logins.
+PRUNE_SESSIONS = """
+DELETE FROM sessions
+WHERE id IN (
+    SELECT id
+    FROM sessions
+    WHERE expires < {before}
+    LIMIT {limit}
+    FOR UPDATE SKIP LOCKED
+)
+"""
+
+ARCHIVE_SESSIONS = """
+WITH pruned AS (
+    DELETE FROM sessions
+    WHERE id IN (
+        SELECT id
+        FROM sessions
+        WHERE expires < {before}
+        LIMIT {limit}
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, user_id, created, expires, ip, disabled
+)
+INSERT INTO sessions_archive(id, user_id, created, expires, ip, disabled)
+SELECT id, user_id, created, expires, ip, disabled
+FROM pruned
+"""
+
+GET_SESSION_PARTITIONS = """
+SELECT child.relname AS name, pg_inherits.inhdetachpending AS detach_pending
+FROM pg_inherits
+JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+WHERE pg_inherits.inhparent = 'sessions'::regclass
+"""
@@ -14,8 +14,19 @@ GET_USERS = """
 SELECT id, username, password, name, scopes
 FROM users
 WHERE {where}
+ORDER BY id
+LIMIT {limit}
 """
 
+# Representative filters for GET_USERS, checked against the indexes by
+# `services postgres migrate --explain`.
+GET_USERS_WHERE = [
+    "id = ANY({id})",
+    "username = ANY({username})",
+    "scopes @> {scopes}",
+    "id > {after_id}",
+]
+
 CREATE_USER = """
 INSERT INTO users(username, password, name, scopes)
 VALUES ({username}, {password}, {name}, {scopes})
@@ -1,5 +1,6 @@
-from datetime import datetime
-from typing import Optional, Union, Self
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, AsyncIterator, NamedTuple, Optional, Union, Self
 
 from database import database
 
@@ -10,20 +11,42 @@ from stores.queries.sessions import (
     CREATE_SESSION,
     UPDATE_SESSION,
     DELETE_SESSION,
+    PRUNE_SESSIONS,
+    ARCHIVE_SESSIONS,
+    GET_SESSION_PARTITIONS,
 )
-from shared.python.helpers.to_filter import to_filter, to_array_filter
+from shared.python.config.auth import SESSION_DURATION
+from shared.python.database import count_rows
+from shared.python.database.bulk import quote_identifier
+from shared.python.database.query import (
+    Keyset,
+    compile_query,
+    to_array,
+    to_keyset,
+    to_where,
+)
+
+# Partitions of a sessions table partitioned by expires hold a single day each.
+PARTITION_NAME = re.compile(r"^sessions_p(\d{8})$")
+
+
+class SessionPartition(NamedTuple):
+    name: str
+    detach_pending: bool
 
 
 class SessionsStore:
     def __call__(self) -> Self:
         return self
 
-    async def get_session(self, id: int) -> Optional[Session]:
-        connection = await database.transaction()
-        response = await connection.fetchrow(GET_SESSION_BY_ID.format(id=to_filter(id)))
+    async def get_session(self, id: int, primary: bool = False) -> Optional[Session]:
+        query = compile_query(GET_SESSION_BY_ID)
+        response = await database.fetchrow(
+            query.sql, *query.arguments(id=id), replica=not primary
+        )
         return Session(**dict(response)) if response is not None else None
 
-    async def get_sessions(
+    def _get_sessions_query(
         self,
         id: Optional[Union[int, list[int]]] = None,
         user_id: Optional[Union[int, list[int]]] = None,
@@ -33,66 +56,205 @@ class SessionsStore:
         created_lte: Optional[datetime] = None,
         expires_gte: Optional[datetime] = None,
         expires_lte: Optional[datetime] = None,
-    ) -> list[Session]:
+        after: Optional[Keyset] = None,
+        limit: Optional[int] = None,
+    ) -> tuple[str, list[Any]]:
         where = []
 
         if id is not None:
-            where.append(f"id IN {to_array_filter(id)}")
+            where.append("id = ANY({id})")
         if user_id is not None:
-            where.append(f"user_id IN {to_array_filter(user_id)}")
+            where.append("user_id = ANY({user_id})")
         if ip is not None:
-            where.append(f"ip IN {to_array_filter(ip)}")
+            where.append("ip = ANY({ip})")
+        # A literal lets the planner use the partial index on active sessions.
         if disabled is not None:
-            where.append(f"disabled = {to_filter(disabled)}")
+            where.append("disabled" if disabled else "NOT disabled")
         if created_gte is not None:
-            where.append(f"created >= {to_filter(created_gte)}")
+            where.append("created >= {created_gte}")
         if created_lte is not None:
-            where.append(f"created <= {to_filter(created_lte)}")
+            where.append("created <= {created_lte}")
         if expires_gte is not None:
-            where.append(f"expires >= {to_filter(expires_gte)}")
+            where.append("expires >= {expires_gte}")
         if expires_lte is not None:
-            where.append(f"expires <= {to_filter(expires_lte)}")
+            where.append("expires <= {expires_lte}")
+        if after is not None:
+            where.append(to_keyset("created"))
+
+        query = compile_query(GET_SESSIONS, where=to_where(where))
 
-        connection = await database.transaction()
-        response = await connection.fetch(
-            GET_SESSIONS.format(where=" AND ".join(where) if where else "TRUE")
+        return query.sql, query.arguments(
+            id=to_array(id),
+            user_id=to_array(user_id),
+            ip=to_array(ip),
+            created_gte=created_gte,
+            created_lte=created_lte,
+            expires_gte=expires_gte,
+            expires_lte=expires_lte,
+            after_sort_key=after.sort_key if after is not None else None,
+            after_id=after.id if after is not None else None,
+            limit=limit,
         )
 
+    async def get_sessions(
+        self,
+        id: Optional[Union[int, list[int]]] = None,
+        user_id: Optional[Union[int, list[int]]] = None,
+        ip: Optional[Union[str, list[str]]] = None,
+        disabled: Optional[bool] = None,
+        created_gte: Optional[datetime] = None,
+        created_lte: Optional[datetime] = None,
+        expires_gte: Optional[datetime] = None,
+        expires_lte: Optional[datetime] = None,
+        after: Optional[Keyset] = None,
+        limit: Optional[int] = None,
+        primary: bool = False,
+    ) -> list[Session]:
+        sql, arguments = self._get_sessions_query(
+            id=id,
+            user_id=user_id,
+            ip=ip,
+            disabled=disabled,
+            created_gte=created_gte,
+            created_lte=created_lte,
+            expires_gte=expires_gte,
+            expires_lte=expires_lte,
+            after=after,
+            limit=limit,
+        )
+        response = await database.fetch(sql, *arguments, replica=not primary)
         return [Session(**dict(row)) for row in response]
 
+    async def stream_sessions(
+        self,
+        id: Optional[Union[int, list[int]]] = None,
+        user_id: Optional[Union[int, list[int]]] = None,
+        ip: Optional[Union[str, list[str]]] = None,
+        disabled: Optional[bool] = None,
+        created_gte: Optional[datetime] = None,
+        created_lte: Optional[datetime] = None,
+        expires_gte: Optional[datetime] = None,
+        expires_lte: Optional[datetime] = None,
+        after: Optional[Keyset] = None,
+        limit: Optional[int] = None,
+        primary: bool = False,
+    ) -> AsyncIterator[Session]:
+        sql, arguments = self._get_sessions_query(
+            id=id,
+            user_id=user_id,
+            ip=ip,
+            disabled=disabled,
+            created_gte=created_gte,
+            created_lte=created_lte,
+            expires_gte=expires_gte,
+            expires_lte=expires_lte,
+            after=after,
+            limit=limit,
+        )
+        async for row in database.stream(sql, *arguments, replica=not primary):
+            yield Session(**dict(row))
+
     async def create_session(
         self,
         session: CreateSession,
     ) -> Optional[Session]:
-        connection = await database.transaction()
-        row = await connection.fetchrow(
-            CREATE_SESSION.format(
-                user_id=to_filter(session.user_id),
-                created=to_filter(datetime.utcnow()),
-                expires=to_filter(datetime.utcnow() + SESSION_DURATION),
-                ip=to_filter(session.ip),
-                disabled=to_filter(False),
-            )
+        query = compile_query(CREATE_SESSION)
+        row = await database.fetchrow(
+            query.sql,
+            *query.arguments(
+                user_id=session.user_id,
+                created=datetime.utcnow(),
+                expires=datetime.utcnow() + SESSION_DURATION,
+                ip=session.ip,
+                disabled=False,
+            ),
         )
-        return await self.get_session(id=row["id"])
+        return await self.get_session(id=row["id"], primary=True)
 
     async def update_session(self, session: Session) -> Optional[Session]:
-        connection = await database.transaction()
-        await connection.execute(
-            UPDATE_SESSION.format(
-                id=to_filter(session.id),
-                user_id=to_filter(session.user_id),
-                created=to_filter(session.created),
-                expires=to_filter(session.expires),
-                ip=to_filter(session.ip),
-                disabled=to_filter(session.disabled),
-            )
+        query = compile_query(UPDATE_SESSION)
+        await database.execute(
+            query.sql,
+            *query.arguments(
+                id=session.id,
+                user_id=session.user_id,
+                created=session.created,
+                expires=session.expires,
+                ip=session.ip,
+                disabled=session.disabled,
+            ),
         )
-        return await self.get_session(id=session.id)
+        return await self.get_session(id=session.id, primary=True)
 
     async def delete_session(self, id: int) -> None:
-        connection = await database.transaction()
-        await connection.execute(DELETE_SESSION.format(id=to_filter(id)))
+        query = compile_query(DELETE_SESSION)
+        await database.execute(query.sql, *query.arguments(id=id))
+
+    async def prune_sessions(
+        self, before: datetime, limit: int, archive: bool = False
+    ) -> int:
+        query = compile_query(ARCHIVE_SESSIONS if archive else PRUNE_SESSIONS)
+        status = await database.execute(
+            query.sql, *query.arguments(before=before, limit=limit)
+        )
+        return count_rows("execute", status)
+
+    async def get_session_partitions(self) -> dict[date, SessionPartition]:
+        query = compile_query(GET_SESSION_PARTITIONS)
+        response = await database.fetch(query.sql)
+        partitions = {}
+
+        for row in response:
+            match = PARTITION_NAME.match(row["name"])
+            if match is not None:
+                day = datetime.strptime(match.group(1), "%Y%m%d").date()
+                partitions[day] = SessionPartition(
+                    name=row["name"], detach_pending=row["detach_pending"]
+                )
+
+        return partitions
+
+    async def create_session_partitions(self, start: date, days: int) -> list[str]:
+        partitions = await self.get_session_partitions()
+        created = []
+
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            if day in partitions:
+                continue
+
+            name = f"sessions_p{day:%Y%m%d}"
+            await database.execute(
+                f"CREATE TABLE IF NOT EXISTS {quote_identifier(name)} "
+                + "PARTITION OF sessions "
+                + f"FOR VALUES FROM ('{day}') TO ('{day + timedelta(days=1)}')"
+            )
+            created.append(name)
+
+        return created
+
+    # Dropping a partition removes a whole day of sessions without the dead
+    # tuples and vacuum work a DELETE of the same rows would leave behind. It is
+    # detached concurrently first, since dropping it while attached takes an
+    # ACCESS EXCLUSIVE lock on sessions and blocks every session lookup. A
+    # detach that was interrupted is finalised instead.
+    async def drop_session_partitions(self, before: date) -> list[str]:
+        partitions = await self.get_session_partitions()
+        dropped = []
+
+        for day, partition in sorted(partitions.items()):
+            if day + timedelta(days=1) > before:
+                continue
+
+            name = quote_identifier(partition.name)
+            detach = "FINALIZE" if partition.detach_pending else "CONCURRENTLY"
+            await database.execute(
+                f"ALTER TABLE sessions DETACH PARTITION {name} {detach}"
+            )
+            await database.execute(f"DROP TABLE IF EXISTS {name}")
+            dropped.append(partition.name)
+
+        return dropped
 
 
 sessions_store = SessionsStore()
@@ -1,4 +1,4 @@
-from typing import Optional, Union, Self
+from typing import Any, AsyncIterator, Optional, Union, Self
 
 from fastapi import Request
 from passlib.context import CryptContext
@@ -15,7 +15,13 @@ from stores.queries.users import (
     UPDATE_USER_PASSWORD,
     DELETE_USER,
 )
-from shared.python.helpers.to_filter import to_filter, to_array_filter
+from shared.python.database.query import (
+    Keyset,
+    compile_query,
+    to_array,
+    to_keyset,
+    to_where,
+)
 
 
 class UsersStore:
@@ -25,88 +31,148 @@ class UsersStore:
         self.password_context = request.app.password_context
         return self
 
-    async def get_user(self, id: int) -> Optional[User]:
-        connection = await database.transaction()
-        response = await connection.fetchrow(GET_USER_BY_ID.format(id=to_filter(id)))
+    # Reads go to a replica unless `primary` is set. Cached routes set it, as a
+    # replica read just after an invalidation would put the old row back in the
+    # cache for the whole expiry.
+    async def get_user(self, id: int, primary: bool = False) -> Optional[User]:
+        query = compile_query(GET_USER_BY_ID)
+        response = await database.fetchrow(
+            query.sql, *query.arguments(id=id), replica=not primary
+        )
         return User(**dict(response)) if response is not None else None
 
-    async def get_user_by_username(self, username: str) -> Optional[User]:
-        connection = await database.transaction()
-        response = await connection.fetchrow(
-            GET_USER_BY_USERNAME.format(username=to_filter(username))
+    async def get_user_by_username(
+        self, username: str, primary: bool = False
+    ) -> Optional[User]:
+        query = compile_query(GET_USER_BY_USERNAME)
+        response = await database.fetchrow(
+            query.sql, *query.arguments(username=username), replica=not primary
         )
         return User(**dict(response)) if response is not None else None
 
-    async def get_users(
+    def _get_users_query(
         self,
         id: Optional[Union[int, list[int]]] = None,
         username: Optional[Union[str, list[str]]] = None,
         name: Optional[Union[str, list[str]]] = None,
         scopes: Optional[Union[str, list[str]]] = None,
-    ) -> list[User]:
+        after: Optional[Keyset] = None,
+        limit: Optional[int] = None,
+    ) -> tuple[str, list[Any]]:
         where = []
 
         if id is not None:
-            where.append(f"id IN {to_array_filter(id)}")
+            where.append("id = ANY({id})")
         if username is not None:
-            where.append(f"username IN {to_array_filter(username)}")
+            where.append("username = ANY({username})")
         if name is not None:
-            where.append(f"name IN {to_array_filter(name)}")
+            where.append("name = ANY({name})")
         if scopes is not None:
-            where.append(f"scopes @> {to_array_filter(name)}")
-
-        connection = await database.transaction()
-        response = await connection.fetch(
-            GET_USERS.format(where=" AND ".join(where) if where else "TRUE")
+            where.append("scopes @> {scopes}")
+        if after is not None:
+            where.append(to_keyset())
+
+        query = compile_query(GET_USERS, where=to_where(where))
+
+        return query.sql, query.arguments(
+            id=to_array(id),
+            username=to_array(username),
+            name=to_array(name),
+            scopes=to_array(scopes),
+            after_id=after.id if after is not None else None,
+            limit=limit,
         )
 
+    async def get_users(
+        self,
+        id: Optional[Union[int, list[int]]] = None,
+        username: Optional[Union[str, list[str]]] = None,
+        name: Optional[Union[str, list[str]]] = None,
+        scopes: Optional[Union[str, list[str]]] = None,
+        after: Optional[Keyset] = None,
+        limit: Optional[int] = None,
+        primary: bool = False,
+    ) -> list[User]:
+        sql, arguments = self._get_users_query(
+            id=id,
+            username=username,
+            name=name,
+            scopes=scopes,
+            after=after,
+            limit=limit,
+        )
+        response = await database.fetch(sql, *arguments, replica=not primary)
         return [User(**dict(row)) for row in response]
 
+    async def stream_users(
+        self,
+        id: Optional[Union[int, list[int]]] = None,
+        username: Optional[Union[str, list[str]]] = None,
+        name: Optional[Union[str, list[str]]] = None,
+        scopes: Optional[Union[str, list[str]]] = None,
+        after: Optional[Keyset] = None,
+        limit: Optional[int] = None,
+        primary: bool = False,
+    ) -> AsyncIterator[User]:
+        sql, arguments = self._get_users_query(
+            id=id,
+            username=username,
+            name=name,
+            scopes=scopes,
+            after=after,
+            limit=limit,
+        )
+        async for row in database.stream(sql, *arguments, replica=not primary):
+            yield User(**dict(row))
+
     async def create_user(self, user: CreateUser) -> Optional[User]:
-        connection = await database.transaction()
-        row = await connection.fetchrow(
-            CREATE_USER.format(
-                username=to_filter(user.username),
-                password=to_filter(self.password_context.hash(user.password)),
-                name=to_filter(user.name),
-                scopes=to_array_filter(user.scopes),
-            )
+        query = compile_query(CREATE_USER)
+        row = await database.fetchrow(
+            query.sql,
+            *query.arguments(
+                username=user.username,
+                password=self.password_context.hash(user.password),
+                name=user.name,
+                scopes=user.scopes,
+            ),
         )
-        return await self.get_user(id=row["id"])
+        return await self.get_user(id=row["id"], primary=True)
 
     async def update_user(self, user: User) -> Optional[User]:
-        connection = await database.transaction()
-        await connection.execute(
-            UPDATE_USER.format(
-                id=to_filter(user.id),
-                username=to_filter(user.username),
-                name=to_filter(user.name),
-                scopes=to_array_filter(user.scopes),
-            )
+        query = compile_query(UPDATE_USER)
+        await database.execute(
+            query.sql,
+            *query.arguments(
+                id=user.id,
+                username=user.username,
+                name=user.name,
+                scopes=user.scopes,
+            ),
         )
-        return await self.get_user(id=user.id)
+        return await self.get_user(id=user.id, primary=True)
 
     async def update_user_password(self, user: User) -> Optional[User]:
-        connection = await database.transaction()
-        await connection.execute(
-            UPDATE_USER_PASSWORD.format(
-                id=to_filter(user.id),
-                username=to_filter(user.username),
-                password=to_filter(self.password_context.hash(user.password)),
-                name=to_filter(user.name),
-                scopes=to_array_filter(user.scopes),
-            )
+        query = compile_query(UPDATE_USER_PASSWORD)
+        await database.execute(
+            query.sql,
+            *query.arguments(
+                id=user.id,
+                username=user.username,
+                password=self.password_context.hash(user.password),
+                name=user.name,
+                scopes=user.scopes,
+            ),
         )
-        return await self.get_user(id=user.id)
+        return await self.get_user(id=user.id, primary=True)
 
     async def delete_user(self, id: int) -> None:
-        connection = await database.transaction()
-        await connection.execute(DELETE_USER.format(id=to_filter(id)))
+        query = compile_query(DELETE_USER)
+        await database.execute(query.sql, *query.arguments(id=id))
 
     async def verify_user_password(
         self, username: str, password: str
     ) -> Optional[User]:
-        user = await self.get_user_by_username(username=username)
+        user = await self.get_user_by_username(username=username, primary=True)
 
         if user is None:
             return None
@@ -1,7 +1,17 @@
-from fastapi import HTTPException
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException, Query, Request
 
+from shared.python.database.query import Keyset
 from shared.python.speedyapi import APIRouter
+from shared.python.speedyapi.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    to_page,
+)
 from shared.python.models.measurement import CreateMeasurement, Measurement
+from shared.python.models.pagination import Page
 from shared.python.helpers.load_json_file import load_json_file
 
 MEASUREMENTS_V0_ROUTER = APIRouter(prefix="/v0/measurements", tags=["measurements"])
@@ -14,12 +24,36 @@ def get_measurement(id: int) -> Measurement:
     
     raise HTTPException(status=404)
 
-@MEASUREMENTS_V0_ROUTER.get("/", response_model=list[Measurement])
-def get_measurements() -> Measurement:
-    return [
-        Measurement.parse_obj(measurement)
-        for measurement in load_json_file("test-data/measurements.json")
-    ]
+@MEASUREMENTS_V0_ROUTER.get("/", response_model=Page[Measurement])
+def get_measurements(
+    request: Request,
+    cursor: Optional[str] = Query(default=None),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+) -> Page[Measurement]:
+    after = decode_cursor(cursor=cursor, sort_type=datetime.fromisoformat)
+    measurements = sorted(
+        (
+            Measurement.parse_obj(measurement)
+            for measurement in load_json_file("test-data/measurements.json")
+        ),
+        key=lambda measurement: (measurement.timestamp, measurement.id),
+    )
+
+    if after is not None:
+        measurements = [
+            measurement
+            for measurement in measurements
+            if (measurement.timestamp, measurement.id) > after
+        ]
+
+    return to_page(
+        request=request,
+        items=measurements[: limit + 1],
+        limit=limit,
+        keyset=lambda measurement: Keyset(
+            sort_key=measurement.timestamp, id=measurement.id
+        ),
+    )
 
 @MEASUREMENTS_V0_ROUTER.post("/", response_model=Measurement)
 def create_measurement(measurement: CreateMeasurement) -> Measurement:
@@ -0,0 +1,106 @@
+-- Rebuilds sessions as a table range partitioned by expires, one partition per
+-- day, so the session pruner can drop whole days of expired sessions at once.
+-- Applied with `services postgres migrate --optional partition_sessions_by_expires`,
+-- after which session_pruning.partitioned should be enabled.
+ALTER TABLE {db.tables.sessions.schema}.{db.tables.sessions.name}
+    RENAME TO {db.tables.sessions.name}_unpartitioned;
+ALTER SEQUENCE {db.tables.sessions.schema}.{db.tables.sessions.name}_id_seq OWNED BY NONE;
+
+DROP INDEX IF EXISTS {db.tables.sessions.schema}.sessions_active_user_id_expires_idx;
+DROP INDEX IF EXISTS {db.tables.sessions.schema}.sessions_user_id_idx;
+DROP INDEX IF EXISTS {db.tables.sessions.schema}.sessions_created_id_idx;
+DROP INDEX IF EXISTS {db.tables.sessions.schema}.sessions_expires_idx;
+DROP INDEX IF EXISTS {db.tables.sessions.schema}.sessions_ip_idx;
+
+-- The partition key has to be part of the primary key.
+CREATE TABLE {db.tables.sessions.schema}.{db.tables.sessions.name} (
+    id             INTEGER NOT NULL DEFAULT nextval('{db.tables.sessions.schema}.{db.tables.sessions.name}_id_seq'),
+    user_id        INTEGER REFERENCES {db.tables.users.schema}.{db.tables.users.name}(id),
+    created        TIMESTAMP NOT NULL,
+    expires        TIMESTAMP NOT NULL,
+    ip             TEXT NOT NULL,
+    disabled       BOOLEAN DEFAULT FALSE,
+    PRIMARY KEY (id, expires)
+) PARTITION BY RANGE (expires);
+
+-- There is no default partition, since partitions can't be detached
+-- concurrently while one exists. Sessions older than a week go into a single
+-- history partition instead. It is named for the last day it holds, so the
+-- pruner drops it like any other day. Daily partitions run from there to a
+-- week ahead, or to the latest expiry if that is further out, and the pruner
+-- keeps creating them ahead from then on.
+DO $$
+DECLARE
+    day DATE;
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE %I.%I PARTITION OF %I.%I FOR VALUES FROM (MINVALUE) TO (%L)',
+        '{db.tables.sessions.schema}',
+        '{db.tables.sessions.name}_p' || to_char(current_date - 8, 'YYYYMMDD'),
+        '{db.tables.sessions.schema}',
+        '{db.tables.sessions.name}',
+        current_date - 7
+    );
+
+    FOR day IN
+        SELECT generate_series(
+            current_date - 7,
+            GREATEST(
+                current_date + 7,
+                (SELECT max(expires)::date FROM {db.tables.sessions.schema}.{db.tables.sessions.name}_unpartitioned)
+            ),
+            interval '1 day'
+        )::date
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I.%I PARTITION OF %I.%I FOR VALUES FROM (%L) TO (%L)',
+            '{db.tables.sessions.schema}',
+            '{db.tables.sessions.name}_p' || to_char(day, 'YYYYMMDD'),
+            '{db.tables.sessions.schema}',
+            '{db.tables.sessions.name}',
+            day,
+            day + 1
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO {db.tables.sessions.schema}.{db.tables.sessions.name}(id, user_id, created, expires, ip, disabled)
+SELECT id, user_id, created, expires, ip, disabled
+FROM {db.tables.sessions.schema}.{db.tables.sessions.name}_unpartitioned;
+
+DROP TABLE {db.tables.sessions.schema}.{db.tables.sessions.name}_unpartitioned;
+
+CREATE INDEX sessions_active_user_id_expires_idx
+    ON {db.tables.sessions.schema}.{db.tables.sessions.name} (user_id, expires)
+    INCLUDE (id, created, ip)
+    WHERE NOT disabled;
+CREATE INDEX sessions_user_id_idx
+    ON {db.tables.sessions.schema}.{db.tables.sessions.name} (user_id);
+CREATE INDEX sessions_created_id_idx
+    ON {db.tables.sessions.schema}.{db.tables.sessions.name} (created, id);
+CREATE INDEX sessions_expires_idx
+    ON {db.tables.sessions.schema}.{db.tables.sessions.name} (expires);
+CREATE INDEX sessions_ip_idx
+    ON {db.tables.sessions.schema}.{db.tables.sessions.name} (ip);
+
+-- The pruner creates and drops partitions, which needs ownership of the table
+-- and of every partition as well as CREATE on the schema.
+DO $$
+DECLARE
+    child REGCLASS;
+BEGIN
+    FOR child IN
+        SELECT inhrelid::regclass
+        FROM pg_inherits
+        WHERE inhparent = '{db.tables.sessions.schema}.{db.tables.sessions.name}'::regclass
+    LOOP
+        EXECUTE format('ALTER TABLE %s OWNER TO %I', child, '{secrets.authorisation.username}');
+    END LOOP;
+END $$;
+
+ALTER TABLE {db.tables.sessions.schema}.{db.tables.sessions.name} OWNER TO {secrets.authorisation.username};
+ALTER SEQUENCE {db.tables.sessions.schema}.{db.tables.sessions.name}_id_seq OWNER TO {secrets.authorisation.username};
+ALTER SEQUENCE {db.tables.sessions.schema}.{db.tables.sessions.name}_id_seq
+    OWNED BY {db.tables.sessions.schema}.{db.tables.sessions.name}.id;
+GRANT CREATE ON SCHEMA {db.tables.sessions.schema} TO {secrets.authorisation.username};
+GRANT SELECT ON {db.tables.sessions.schema}.{db.tables.sessions.name} TO {secrets.api.username};
@@ -0,0 +1,6 @@
+-- no-transaction
+-- Login looks up a user's active sessions by user_id, disabled and expires.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sessions_active_user_id_expires_idx
+    ON {db.tables.sessions.schema}.{db.tables.sessions.name} (user_id, expires)
+    INCLUDE (id, created, ip)
+    WHERE NOT disabled;
@@ -0,0 +1,4 @@
+-- no-transaction
+-- Session listings filtered by user and the users foreign key.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sessions_user_id_idx
+    ON {db.tables.sessions.schema}.{db.tables.sessions.name} (user_id);
@@ -0,0 +1,4 @@
+-- no-transaction
+-- Keyset pagination of session listings orders and seeks by (created, id).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sessions_created_id_idx
+    ON {db.tables.sessions.schema}.{db.tables.sessions.name} (created, id);
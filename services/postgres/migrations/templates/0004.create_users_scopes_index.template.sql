@@ -0,0 +1,4 @@
+-- no-transaction
+-- User listings filtered with scopes @> ARRAY[...].
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_scopes_idx
+    ON {db.tables.users.schema}.{db.tables.users.name} USING GIN (scopes);
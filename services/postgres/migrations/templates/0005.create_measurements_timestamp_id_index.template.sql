@@ -0,0 +1,4 @@
+-- no-transaction
+-- Keyset pagination of measurement listings orders and seeks by (timestamp, id).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS measurements_timestamp_id_idx
+    ON {db.tables.measurements.schema}.{db.tables.measurements.name} (timestamp, id);
@@ -0,0 +1,4 @@
+-- no-transaction
+-- The session pruner selects expired sessions in batches by expires.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sessions_expires_idx
+    ON {db.tables.sessions.schema}.{db.tables.sessions.name} (expires);
@@ -0,0 +1,12 @@
+-- Expired sessions are moved here when session_pruning.archive is enabled.
+CREATE TABLE IF NOT EXISTS {db.tables.sessions.schema}.{db.tables.sessions.name}_archive (
+    id             INTEGER PRIMARY KEY,
+    user_id        INTEGER,
+    created        TIMESTAMP NOT NULL,
+    expires        TIMESTAMP NOT NULL,
+    ip             TEXT NOT NULL,
+    disabled       BOOLEAN DEFAULT FALSE
+);
+
+GRANT ALL PRIVILEGES ON {db.tables.sessions.schema}.{db.tables.sessions.name}_archive TO {secrets.authorisation.username};
+GRANT SELECT ON {db.tables.sessions.schema}.{db.tables.sessions.name}_archive TO {secrets.api.username};
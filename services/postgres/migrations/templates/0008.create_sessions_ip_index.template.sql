@@ -0,0 +1,4 @@
+-- no-transaction
+-- Session listings filtered by ip.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sessions_ip_idx
+    ON {db.tables.sessions.schema}.{db.tables.sessions.name} (ip);
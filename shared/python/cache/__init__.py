@@ -1,15 +1,53 @@
+import gzip
+import hashlib
 import inspect
 import asyncio
 import logging
+import random
+import re
 from functools import wraps
-from typing import Any, Callable, Optional, Self
-from fastapi import Request, Response
-from pydantic import BaseModel
-from redis.asyncio import Redis
+from urllib.parse import urlencode
+from uuid import uuid4
+from typing import Any, Awaitable, Callable, NamedTuple, Optional, Self, Union
+from fastapi import HTTPException, Request, Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+from pydantic import BaseModel, Field
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.asyncio.client import Pipeline
+from redis.asyncio.sentinel import Sentinel
+from redis.exceptions import (
+    ConnectionError as RedisConnectionError,
+    TimeoutError as RedisTimeoutError,
+)
+from shared.python.models.cache import PopularCacheKey
 from shared.python.models.authorisation import UserCredentials
 
 from shared.python.speedyapi import Logger
 from shared.python.json import serialise_json, parse_json
+from shared.python.cache.breaker import CircuitBreaker
+from shared.python.cache.codec import Codec, NegativeEntry
+from shared.python.cache.local import LocalCache
+from shared.python.cache.popularity import PopularitySketch
+from shared.python.cache.shard import ShardedRedis
+from shared.python.cache.stats import CacheStats, Measurement
+
+# Returned in place of a value for missing keys when asked for, so that falsy
+# cached values ([], {}, 0, "") are not mistaken for misses.
+MISSING: Any = object()
+
+
+class ClearPatternResult(BaseModel):
+    scanned: int = Field(description="The number of keys matched by the scan.")
+    removed: int = Field(description="The number of keys removed from the cache.")
+
+
+class RouteEntry(NamedTuple):
+    body: bytes
+    etag: str
+    gzip: Optional[bytes] = None
 
 
 class Cache:
@@ -19,8 +57,47 @@ class Cache:
     user: Optional[str]
     password: Optional[str]
     name: Optional[str]
-    client: Optional[Redis]
+    client: Optional[Union[Redis, ShardedRedis]]
+    readers: list[Redis]
+    replicas: Optional[list[str]]
+    sentinels: Optional[list[str]]
+    sentinel_service: str
+    sentinel_read_replicas: bool
+    shards: Optional[list[str]]
     alias: Optional[dict[str, str]]
+    alias_pattern: Optional[re.Pattern[str]]
+    route_prefixes: dict[tuple[str, str], str]
+    route_prefix_cache_size: int
+    route_query_hash_length: Optional[int]
+    tag_prefix: str
+    invalidated_prefix: str
+    invalidation_window: float
+    id: str
+    local: Optional[LocalCache]
+    invalidation_channel: str
+    invalidation_task: Optional[asyncio.Task]
+    lock_prefix: str
+    lock_poll_interval: float
+    inflight: dict[str, asyncio.Task]
+    revalidations: dict[str, asyncio.Task]
+    gzip_minimum_size: int
+    codec: Codec
+    stats: CacheStats
+    popularity: Optional[PopularitySketch]
+    popularity_key: str
+    popularity_decay_key: str
+    popularity_interval: float
+    popularity_decay: float
+    popularity_task: Optional[asyncio.Task]
+    max_connections: int
+    pool_timeout: Optional[float]
+    socket_timeout: Optional[float]
+    socket_connect_timeout: Optional[float]
+    socket_keepalive: bool
+    health_check_interval: float
+    reconnect_delay: float
+    reconnect_max_delay: float
+    breaker: CircuitBreaker
 
     def __init__(
         self,
@@ -31,6 +108,36 @@ class Cache:
         name: Optional[str] = None,
         logger: Optional[Logger] = None,
         alias: Optional[dict[str, str]] = None,
+        tag_prefix: str = "tag:",
+        invalidated_prefix: str = "invalidated:",
+        invalidation_window: float = 5,
+        local: Optional[LocalCache] = None,
+        invalidation_channel: str = "cache:invalidate",
+        lock_prefix: str = "lock:",
+        lock_poll_interval: float = 0.05,
+        gzip_minimum_size: int = 500,
+        codec: Optional[Codec] = None,
+        stats: Optional[CacheStats] = None,
+        popularity: Optional[PopularitySketch] = None,
+        popularity_key: str = "cache:popular",
+        popularity_interval: float = 60,
+        popularity_decay: float = 0.5,
+        max_connections: int = 50,
+        pool_timeout: Optional[float] = 1,
+        socket_timeout: Optional[float] = 1,
+        socket_connect_timeout: Optional[float] = 1,
+        socket_keepalive: bool = True,
+        health_check_interval: float = 30,
+        reconnect_delay: float = 0.5,
+        reconnect_max_delay: float = 30,
+        breaker: Optional[CircuitBreaker] = None,
+        replicas: Optional[list[str]] = None,
+        sentinels: Optional[list[str]] = None,
+        sentinel_service: str = "mymaster",
+        sentinel_read_replicas: bool = False,
+        shards: Optional[list[str]] = None,
+        route_prefix_cache_size: int = 4096,
+        route_query_hash_length: Optional[int] = None,
     ) -> None:
         self.user = user
         self.password = password
@@ -38,8 +145,54 @@ class Cache:
         self.port = port
         self.name = name
         self.client = None
+        self.readers = []
+        self.replicas = replicas
+        self.sentinels = sentinels
+        self.sentinel_service = sentinel_service
+        self.sentinel_read_replicas = sentinel_read_replicas
+        self.shards = shards
         self.logger = logger or logging.getLogger()
         self.alias = alias
+        # Longest first so an alias that contains another still wins.
+        self.alias_pattern = (
+            re.compile(
+                "|".join(re.escape(value) for value in sorted(alias, key=len)[::-1])
+            )
+            if alias
+            else None
+        )
+        self.route_prefixes = {}
+        self.route_prefix_cache_size = route_prefix_cache_size
+        self.route_query_hash_length = route_query_hash_length
+        self.tag_prefix = tag_prefix
+        self.invalidated_prefix = invalidated_prefix
+        self.invalidation_window = invalidation_window
+        self.id = uuid4().hex
+        self.local = local
+        self.invalidation_channel = invalidation_channel
+        self.invalidation_task = None
+        self.lock_prefix = lock_prefix
+        self.lock_poll_interval = lock_poll_interval
+        self.inflight = {}
+        self.revalidations = {}
+        self.gzip_minimum_size = gzip_minimum_size
+        self.codec = codec or Codec()
+        self.stats = stats or CacheStats()
+        self.popularity = popularity
+        self.popularity_key = popularity_key
+        self.popularity_decay_key = f"{popularity_key}:decayed"
+        self.popularity_interval = popularity_interval
+        self.popularity_decay = popularity_decay
+        self.popularity_task = None
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.socket_timeout = socket_timeout
+        self.socket_connect_timeout = socket_connect_timeout
+        self.socket_keepalive = socket_keepalive
+        self.health_check_interval = health_check_interval
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.breaker = breaker or CircuitBreaker()
 
     def __call__(self) -> Self:
         return self
@@ -50,24 +203,95 @@ class Cache:
             + f"username: {self.user if self.user is not None else 'None'}"
         )
 
-        success = False
+        attempt = 0
 
-        while not success:
+        while True:
             try:
                 await self._initialise()
-                success = True
+                break
             except Exception as error:
-                self.logger.error(f"Failed to connect to cache, retrying in 5s: {error}")
-                await asyncio.sleep(5)
-                await self.initialise()
+                delay = min(
+                    self.reconnect_delay * 2**attempt, self.reconnect_max_delay
+                )
+                attempt += 1
+                self.logger.error(
+                    f"Failed to connect to cache, retrying in {delay}s: {error}"
+                )
+                await asyncio.sleep(delay)
 
         self.logger.info(
             f"Connected to cache at:  redis://{self.host}:{self.port}, "
             + f"username: {self.user if self.user is not None else 'None'}"
         )
 
+        if self.local is not None and self.invalidation_task is None:
+            self.invalidation_task = asyncio.create_task(
+                self._listen_for_invalidations()
+            )
+        if self.popularity is not None and self.popularity_task is None:
+            self.popularity_task = asyncio.create_task(self._flush_popularity())
+
 
     async def _initialise(self) -> None:
+        readers: list[Redis] = []
+
+        if self.sentinels:
+            sentinel = Sentinel(
+                [self._address(address=address) for address in self.sentinels],
+                sentinel_kwargs={
+                    "socket_timeout": self.socket_timeout,
+                    "socket_connect_timeout": self.socket_connect_timeout,
+                },
+                username=self.user,
+                password=self.password,
+                db=int(self.name or 0),
+                **self._connection_options(),
+            )
+            client = sentinel.master_for(self.sentinel_service, redis_class=Redis)
+            if self.sentinel_read_replicas:
+                readers.append(
+                    sentinel.slave_for(self.sentinel_service, redis_class=Redis)
+                )
+        elif self.shards:
+            client = ShardedRedis(
+                clients={
+                    shard: self._create_client(address=shard) for shard in self.shards
+                }
+            )
+        else:
+            client = self._create_client(address=f"{self.host}:{self.port}")
+            readers += [
+                self._create_client(address=replica) for replica in self.replicas or []
+            ]
+
+        try:
+            await asyncio.gather(client.ping(), *(reader.ping() for reader in readers))
+        except Exception:
+            await asyncio.gather(
+                client.aclose(),
+                *(reader.aclose() for reader in readers),
+                return_exceptions=True,
+            )
+            raise
+
+        self.client = client
+        self.readers = readers
+        self.breaker.record_success()
+
+    def _address(self, address: str) -> tuple[str, int]:
+        host, port = address.rsplit(":", 1)
+        return host, int(port)
+
+    def _connection_options(self) -> dict[str, Any]:
+        return {
+            "max_connections": self.max_connections,
+            "socket_timeout": self.socket_timeout,
+            "socket_connect_timeout": self.socket_connect_timeout,
+            "socket_keepalive": self.socket_keepalive,
+            "health_check_interval": self.health_check_interval,
+        }
+
+    def _create_client(self, address: str) -> Redis:
         user_prefix = ""
         cache_name_suffix = ""
 
@@ -79,74 +303,897 @@ class Cache:
         if self.name is not None:
             cache_name_suffix = f"/{self.name}"
 
-        self.client = await Redis.from_url(
-            f"redis://{user_prefix}{self.host}:{self.port}{cache_name_suffix}"
+        return Redis(
+            connection_pool=BlockingConnectionPool.from_url(
+                f"redis://{user_prefix}{address}{cache_name_suffix}",
+                timeout=self.pool_timeout,
+                **self._connection_options(),
+            )
         )
 
+    # Reads may be served by a replica and so can briefly trail writes made
+    # to the primary. Route entries are always read from the primary, since a
+    # lagging replica could still return an entry that was just invalidated.
+    @property
+    def reader(self) -> Union[Redis, ShardedRedis]:
+        return random.choice(self.readers) if self.readers else self.client
 
-    def alias_key(self, key: str) -> str:
-        if self.alias is not None:
-            for value, alias in self.alias.items():
-                key = str(key).replace(value, alias)
+    def available(self) -> bool:
+        return self.client is not None and self.breaker.allow()
 
-        return key
+    async def _execute[T](self, command: Awaitable[T]) -> T:
+        try:
+            result = await command
+        except Exception as error:
+            self._record_failure(error=error)
+            raise
 
-    async def get[T](self, key: str) -> T:
-        key = self.alias_key(key=key)
-        value = None
+        self.breaker.record_success()
+        return result
+
+    def _record_failure(self, error: Exception) -> None:
+        if not isinstance(
+            error, (RedisConnectionError, RedisTimeoutError, TimeoutError)
+        ):
+            return
+
+        if self.breaker.record_failure():
+            self.logger.error(
+                f"Cache unavailable, skipping it for {self.breaker.reset_timeout}s: "
+                + f"{error}"
+            )
 
-        if self.client is not None:
+    async def _listen_for_invalidations(self) -> None:
+        while True:
             try:
-                cache_value = await self.client.get(key)
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(self.invalidation_channel)
+                # Anything published while we were unsubscribed has been missed.
+                self.local.clear()
 
-                if cache_value is not None:
-                    value = parse_json(cache_value)
+                # Poll rather than listen so idle periods don't trip the read
+                # timeout on the subscribed connection.
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=1
+                    )
+                    if message is not None:
+                        self._apply_invalidation(parse_json(message["data"]))
+            except asyncio.CancelledError:
+                raise
             except Exception as error:
-                self.logger.error(f"Errored when getting '{key}' from cache: {error}")
-        else:
+                self.logger.error(
+                    f"Cache invalidation listener failed, retrying in 5s: {error}"
+                )
+                self.local.clear()
+                await asyncio.sleep(5)
+
+    def _apply_invalidation(self, message: dict[str, Any]) -> None:
+        if message.get("source") == self.id:
+            return
+
+        for key in message.get("keys", []):
+            self.local.delete(key=key)
+        if message.get("pattern") is not None:
+            self.local.delete_pattern(pattern=message["pattern"])
+
+    async def _publish_invalidation(
+        self, keys: Optional[list[str]] = None, pattern: Optional[str] = None
+    ) -> None:
+        if self.local is None or not self.available():
+            return
+
+        try:
+            await self._execute(
+                self.client.publish(
+                    self.invalidation_channel,
+                    serialise_json(
+                        {"source": self.id, "keys": keys or [], "pattern": pattern}
+                    ),
+                )
+            )
+        except Exception as error:
+            self.logger.error(f"Errored when publishing cache invalidation: {error}")
+
+    async def _flush_popularity(self) -> None:
+        while True:
+            await asyncio.sleep(self.popularity_interval)
+            await self.flush_popularity()
+
+    async def flush_popularity(self) -> None:
+        if self.popularity is None or not self.available():
+            return
+
+        popular = self.popularity.top(limit=self.popularity.capacity)
+
+        try:
+            # Older counts decay once per interval so the ranking follows the
+            # current traffic rather than everything since the key was made.
+            # Only the first worker to flush in an interval applies it, so the
+            # rate doesn't depend on how many workers are running.
+            decay = await self._execute(
+                self.client.set(
+                    self.popularity_decay_key,
+                    self.id,
+                    nx=True,
+                    px=int(self.popularity_interval * 1000),
+                )
+            )
+            pipeline = self.client.pipeline(transaction=True)
+            if decay:
+                pipeline.zunionstore(
+                    self.popularity_key, {self.popularity_key: self.popularity_decay}
+                )
+            for path, score in popular:
+                pipeline.zincrby(self.popularity_key, score, path)
+            pipeline.zremrangebyrank(
+                self.popularity_key, 0, -(self.popularity.capacity + 1)
+            )
+            await self._execute(pipeline.execute())
+            self.popularity.reset()
+        except Exception as error:
+            self.logger.error(f"Errored when flushing cache popularity: {error}")
+
+    async def get_popular(self, limit: int = 100) -> list[PopularCacheKey]:
+        scores: dict[str, float] = {}
+
+        if self.available():
+            try:
+                for path, score in await self._execute(
+                    self.reader.zrevrange(
+                        self.popularity_key, 0, limit - 1, withscores=True
+                    )
+                ):
+                    scores[path.decode()] = score
+            except Exception as error:
+                self.logger.error(f"Errored when getting cache popularity: {error}")
+        if self.popularity is not None:
+            for path, score in self.popularity.top(limit=limit):
+                scores[path] = scores.get(path, 0) + score
+
+        return [
+            PopularCacheKey(path=path, score=score)
+            for path, score in sorted(
+                scores.items(), key=lambda popular: popular[1], reverse=True
+            )[:limit]
+        ]
+
+    def alias_key(self, key: str) -> str:
+        key = str(key)
+
+        if self.alias_pattern is None or self.alias_pattern.search(key) is None:
+            return key
+
+        return self.alias_pattern.sub(lambda match: self.alias[match.group(0)], key)
+
+    async def get[T](self, key: str) -> T:
+        if self.client is None:
             self.logger.warn("Cache not connected.")
 
-        if value is None:
-            value = await self.set(key=key)
+        value, _ = await self.get_with_ttl(key=key)
+
+        if isinstance(value, NegativeEntry):
+            return None
 
         return value
 
+    async def get_with_ttl[T](
+        self, key: str, default: Any = None, primary: bool = False
+    ) -> tuple[Optional[T], Optional[float]]:
+        key = self.alias_key(key=key)
+        value = default
+        ttl = None
+
+        with self.stats.measure(operation="get", key=key) as measurement:
+            if self.local is not None:
+                local_value, local_ttl = self.local.get_with_ttl(key=key)
+                if local_value is not None:
+                    measurement.hits += 1
+                    measurement.local_hits += 1
+                    if isinstance(local_value, NegativeEntry):
+                        measurement.negative_hits += 1
+                    return local_value, local_ttl
+
+            if self.available():
+                try:
+                    client = self.client if primary else self.reader
+                    pipeline = client.pipeline(transaction=False)
+                    pipeline.get(key)
+                    pipeline.pttl(key)
+                    cache_value, pttl = await self._execute(pipeline.execute())
+
+                    if cache_value is not None:
+                        measurement.hits += 1
+                        measurement.bytes_in += len(cache_value)
+                        value = measurement.serialise(self.codec.decode, cache_value)
+                        ttl = pttl / 1000 if pttl >= 0 else None
+                        if isinstance(value, NegativeEntry):
+                            measurement.negative_hits += 1
+
+                        if self.local is not None:
+                            self.local.set(
+                                key=key, value=value, size=len(cache_value), ttl=ttl
+                            )
+                    else:
+                        measurement.misses += 1
+                except Exception as error:
+                    measurement.errors += 1
+                    self.logger.error(
+                        f"Errored when getting '{key}' from cache: {error}"
+                    )
+
+        return value, ttl
+
     async def set[T](
-        self, key: str, value: Optional[Any] = None, expiry: Optional[int] = None
+        self,
+        key: str,
+        value: Optional[Any] = None,
+        expiry: Optional[int] = None,
+        tags: Optional[list[str]] = None,
     ) -> T:
         key = self.alias_key(key=key)
-        if self.client is not None:
+        if self.available():
             if value is not None:
-                try:
-                    await self.client.set(key, serialise_json(value), ex=expiry)
-                except Exception as error:
-                    self.logger.error(f"Errored when setting '{key}' in cache: {error}")
+                with self.stats.measure(operation="set", key=key) as measurement:
+                    try:
+                        cache_value = measurement.serialise(self.codec.encode, value)
+                        measurement.bytes_out += len(cache_value)
+
+                        if tags:
+                            pipeline = self.client.pipeline(transaction=False)
+                            pipeline.set(key, cache_value, ex=expiry)
+                            self._add_tags(
+                                pipeline=pipeline, key=key, tags=tags, expiry=expiry
+                            )
+                            await self._execute(pipeline.execute())
+                        else:
+                            await self._execute(
+                                self.client.set(key, cache_value, ex=expiry)
+                            )
+
+                        if self.local is not None:
+                            self.local.set(
+                                key=key, value=value, size=len(cache_value), ttl=expiry
+                            )
+                            await self._publish_invalidation(keys=[key])
+                    except Exception as error:
+                        measurement.errors += 1
+                        self.logger.error(
+                            f"Errored when setting '{key}' in cache: {error}"
+                        )
             else:
                 await self.clear(key=key)
 
         return value
 
+    async def get_many[T](self, keys: list[str]) -> tuple[dict[str, T], list[str]]:
+        aliases = {self.alias_key(key=key): key for key in keys}
+        values: dict[str, T] = {}
+        remaining: list[str] = []
+
+        with self.stats.measure(
+            operation="get_many", key=next(iter(aliases), "")
+        ) as measurement:
+            for alias in aliases:
+                value = self.local.get(key=alias) if self.local is not None else None
+                if value is not None:
+                    measurement.local_hits += 1
+                    values[aliases[alias]] = value
+                else:
+                    remaining.append(alias)
+
+            if remaining and self.available():
+                try:
+                    pipeline = self.reader.pipeline(transaction=False)
+                    pipeline.mget(remaining)
+                    if self.local is not None:
+                        for alias in remaining:
+                            pipeline.pttl(alias)
+                    cache_values, *pttls = await self._execute(pipeline.execute())
+
+                    for index, (alias, cache_value) in enumerate(
+                        zip(remaining, cache_values)
+                    ):
+                        if cache_value is None:
+                            continue
+
+                        measurement.bytes_in += len(cache_value)
+                        value = measurement.serialise(self.codec.decode, cache_value)
+                        values[aliases[alias]] = value
+
+                        if self.local is not None:
+                            self.local.set(
+                                key=alias,
+                                value=value,
+                                size=len(cache_value),
+                                ttl=pttls[index] / 1000 if pttls[index] >= 0 else None,
+                            )
+                except Exception as error:
+                    measurement.errors += 1
+                    self.logger.error(
+                        f"Errored when getting {len(remaining)} keys from cache: "
+                        + f"{error}"
+                    )
+
+            for key, value in values.items():
+                if isinstance(value, NegativeEntry):
+                    measurement.negative_hits += 1
+                    values[key] = None
+
+            measurement.hits += len(values)
+            measurement.misses += len(aliases) - len(values)
+
+        return values, [key for key in keys if key not in values]
+
+    async def set_many(
+        self,
+        values: dict[str, Any],
+        expiry: Optional[Union[int, dict[str, Optional[int]]]] = None,
+    ) -> None:
+        if not values or not self.available():
+            return
+
+        with self.stats.measure(
+            operation="set_many", key=self.alias_key(key=next(iter(values)))
+        ) as measurement:
+            try:
+                pipeline = self.client.pipeline(transaction=False)
+                entries: list[tuple[str, Any, int, Optional[int]]] = []
+
+                for key, value in values.items():
+                    key_expiry = expiry.get(key) if isinstance(expiry, dict) else expiry
+                    alias = self.alias_key(key=key)
+
+                    if value is None:
+                        pipeline.unlink(alias)
+                        if self.local is not None:
+                            self.local.delete(key=alias)
+                        continue
+
+                    cache_value = measurement.serialise(self.codec.encode, value)
+                    measurement.bytes_out += len(cache_value)
+                    pipeline.set(alias, cache_value, ex=key_expiry)
+                    entries.append((alias, value, len(cache_value), key_expiry))
+
+                await self._execute(pipeline.execute())
+
+                if self.local is not None:
+                    for alias, value, size, key_expiry in entries:
+                        self.local.set(
+                            key=alias, value=value, size=size, ttl=key_expiry
+                        )
+                    await self._publish_invalidation(
+                        keys=[self.alias_key(key=key) for key in values]
+                    )
+            except Exception as error:
+                measurement.errors += 1
+                self.logger.error(
+                    f"Errored when setting {len(values)} keys in cache: {error}"
+                )
+
+    async def clear_many(self, keys: list[str]) -> int:
+        aliases = [self.alias_key(key=key) for key in keys]
+
+        if self.local is not None:
+            for alias in aliases:
+                self.local.delete(key=alias)
+        if not aliases or not self.available():
+            return 0
+
+        with self.stats.measure(operation="clear_many", key=aliases[0]) as measurement:
+            try:
+                pipeline = self.client.pipeline(transaction=False)
+                for alias in aliases:
+                    pipeline.unlink(alias)
+                removed = sum(await self._execute(pipeline.execute()))
+
+                if removed:
+                    await self._publish_invalidation(keys=aliases)
+
+                return removed
+            except Exception as error:
+                measurement.errors += 1
+                self.logger.error(
+                    f"Errored when clearing {len(keys)} keys from cache: {error}"
+                )
+
+        return 0
+
+    async def get_entry_with_ttl(
+        self, key: str, default: Any = None
+    ) -> tuple[Optional[RouteEntry], Optional[float]]:
+        key = self.alias_key(key=key)
+        entry = default
+        ttl = None
+
+        with self.stats.measure(operation="get_entry", key=key) as measurement:
+            if self.local is not None:
+                local_entry, local_ttl = self.local.get_with_ttl(key=key)
+                if local_entry is not None:
+                    measurement.hits += 1
+                    measurement.local_hits += 1
+                    if isinstance(local_entry, NegativeEntry):
+                        measurement.negative_hits += 1
+                    return local_entry, local_ttl
+
+            if self.available():
+                try:
+                    pipeline = self.client.pipeline(transaction=False)
+                    pipeline.hgetall(key)
+                    pipeline.pttl(key)
+                    fields, pttl = await self._execute(pipeline.execute())
+
+                    if fields and b"negative" in fields:
+                        entry = measurement.serialise(
+                            self.codec.decode, fields[b"negative"]
+                        )
+                        size = len(fields[b"negative"])
+                        measurement.negative_hits += 1
+                    elif fields:
+                        entry = RouteEntry(
+                            body=fields[b"body"],
+                            etag=(
+                                fields[b"etag"].decode()
+                                if b"etag" in fields
+                                else self.create_etag(body=fields[b"body"])
+                            ),
+                            gzip=fields.get(b"gzip"),
+                        )
+                        size = len(entry.body) + len(entry.gzip or b"")
+
+                    if fields:
+                        ttl = pttl / 1000 if pttl >= 0 else None
+                        measurement.hits += 1
+                        measurement.bytes_in += size
+
+                        if self.local is not None:
+                            self.local.set(key=key, value=entry, size=size, ttl=ttl)
+                    else:
+                        measurement.misses += 1
+                except Exception as error:
+                    measurement.errors += 1
+                    self.logger.error(
+                        f"Errored when getting '{key}' from cache: {error}"
+                    )
+
+        return entry, ttl
+
+    async def get_entry_etag_with_ttl(
+        self, key: str
+    ) -> tuple[Optional[str], Optional[float]]:
+        key = self.alias_key(key=key)
+
+        with self.stats.measure(operation="get_etag", key=key) as measurement:
+            if self.local is not None:
+                entry, ttl = self.local.get_with_ttl(key=key)
+                if isinstance(entry, RouteEntry):
+                    measurement.hits += 1
+                    measurement.local_hits += 1
+                    return entry.etag, ttl
+                if entry is not None:
+                    return None, None
+
+            if self.available():
+                try:
+                    pipeline = self.client.pipeline(transaction=False)
+                    pipeline.hget(key, "etag")
+                    pipeline.pttl(key)
+                    etag, pttl = await self._execute(pipeline.execute())
+
+                    if etag is not None:
+                        measurement.hits += 1
+                        measurement.bytes_in += len(etag)
+                        return etag.decode(), pttl / 1000 if pttl >= 0 else None
+
+                    measurement.misses += 1
+                except Exception as error:
+                    measurement.errors += 1
+                    self.logger.error(
+                        f"Errored when getting '{key}' from cache: {error}"
+                    )
+
+        return None, None
+
+    def create_etag(self, body: bytes) -> str:
+        return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+    def etag_matches(self, request: Request, etag: str) -> bool:
+        if_none_match = request.headers.get("If-None-Match")
+
+        if if_none_match is None:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+
+        # Bodies may be served gzipped or not, so only weak comparison applies.
+        return any(
+            candidate.strip().removeprefix("W/").strip('"') == etag
+            for candidate in if_none_match.split(",")
+        )
+
+    # Rendered through the route's response model and class, exactly as FastAPI
+    # renders an uncached response, so both paths return identical JSON.
+    async def render_route_value(self, request: Request, value: Any) -> bytes:
+        route = request.scope.get("route")
+
+        if not isinstance(route, APIRoute):
+            return JSONResponse(content=jsonable_encoder(value)).body
+
+        content = await serialize_response(
+            field=route.response_field,
+            response_content=value,
+            include=route.response_model_include,
+            exclude=route.response_model_exclude,
+            by_alias=route.response_model_by_alias,
+            exclude_unset=route.response_model_exclude_unset,
+            exclude_defaults=route.response_model_exclude_defaults,
+            exclude_none=route.response_model_exclude_none,
+        )
+        response_class = route.response_class
+
+        if isinstance(response_class, DefaultPlaceholder):
+            response_class = response_class.value
+
+        return response_class(content=content).body
+
+    def create_entry(self, body: bytes) -> RouteEntry:
+        return RouteEntry(
+            body=body,
+            etag=self.create_etag(body=body),
+            gzip=(
+                gzip.compress(body, compresslevel=9)
+                if len(body) >= self.gzip_minimum_size
+                else None
+            ),
+        )
+
+    async def set_entry(
+        self,
+        key: str,
+        entry: Union[RouteEntry, NegativeEntry],
+        expiry: Optional[int] = None,
+        tags: Optional[list[str]] = None,
+    ) -> Union[RouteEntry, NegativeEntry]:
+        key = self.alias_key(key=key)
+        if self.available():
+            with self.stats.measure(operation="set_entry", key=key) as measurement:
+                try:
+                    if isinstance(entry, NegativeEntry):
+                        fields = {
+                            "negative": measurement.serialise(self.codec.encode, entry)
+                        }
+                        size = len(fields["negative"])
+                    else:
+                        fields = {"body": entry.body, "etag": entry.etag}
+                        if entry.gzip is not None:
+                            fields["gzip"] = entry.gzip
+                        size = len(entry.body) + len(entry.gzip or b"")
+                    measurement.bytes_out += size
+
+                    pipeline = self.client.pipeline(transaction=True)
+                    pipeline.unlink(key)
+                    pipeline.hset(key, mapping=fields)
+                    if expiry is not None:
+                        pipeline.expire(key, expiry)
+                    if tags:
+                        self._add_tags(
+                            pipeline=pipeline, key=key, tags=tags, expiry=expiry
+                        )
+                    await self._execute(pipeline.execute())
+
+                    if self.local is not None:
+                        self.local.set(key=key, value=entry, size=size, ttl=expiry)
+                        await self._publish_invalidation(keys=[key])
+                except Exception as error:
+                    measurement.errors += 1
+                    self.logger.error(f"Errored when setting '{key}' in cache: {error}")
+
+        return entry
+
+    def not_modified_response(self, response: Response, etag: str) -> Response:
+        return Response(
+            status_code=304,
+            headers={**dict(response.headers), "ETag": f'W/"{etag}"'},
+        )
+
+    def entry_response(
+        self, request: Request, response: Response, entry: RouteEntry
+    ) -> Response:
+        if self.etag_matches(request=request, etag=entry.etag):
+            return self.not_modified_response(response=response, etag=entry.etag)
+
+        headers = {**dict(response.headers), "ETag": f'W/"{entry.etag}"'}
+
+        if entry.gzip is not None and "gzip" in request.headers.get(
+            "Accept-Encoding", ""
+        ):
+            headers["Content-Encoding"] = "gzip"
+            headers["Vary"] = "Accept-Encoding"
+            content = entry.gzip
+        else:
+            content = entry.body
+
+        return Response(
+            content=content,
+            status_code=response.status_code or 200,
+            headers=headers,
+            media_type="application/json",
+        )
+
     async def clear(self, key: str) -> None:
         key = self.alias_key(key=key)
-        if self.client is not None:
+        if self.local is not None:
+            self.local.delete(key=key)
+        if self.available():
+            with self.stats.measure(operation="clear", key=key) as measurement:
+                try:
+                    if await self._execute(self.client.delete(key)):
+                        await self._publish_invalidation(keys=[key])
+                except Exception as error:
+                    measurement.errors += 1
+                    self.logger.error(f"Errored when setting '{key}' in cache: {error}")
+
+    async def clear_pattern(
+        self,
+        pattern: str,
+        condition: Optional[Callable[[Any], bool]] = None,
+        batch_size: int = 500,
+    ) -> ClearPatternResult:
+        pattern = self.alias_key(key=pattern)
+        result = ClearPatternResult(scanned=0, removed=0)
+
+        if self.local is not None:
+            self.local.delete_pattern(pattern=pattern)
+        if not self.available():
+            return result
+
+        with self.stats.measure(operation="clear_pattern", key=pattern) as measurement:
             try:
-                await self.client.delete(key)
+                batch: list[bytes] = []
+
+                async for key in self.client.scan_iter(match=pattern, count=batch_size):
+                    batch.append(key)
+                    if len(batch) >= batch_size:
+                        result.scanned += len(batch)
+                        result.removed += await self._clear_batch(
+                            keys=batch, condition=condition, measurement=measurement
+                        )
+                        batch = []
+
+                if batch:
+                    result.scanned += len(batch)
+                    result.removed += await self._clear_batch(
+                        keys=batch, condition=condition, measurement=measurement
+                    )
             except Exception as error:
-                self.logger.error(f"Errored when setting '{key}' in cache: {error}")
+                measurement.errors += 1
+                self._record_failure(error=error)
+                self.logger.error(
+                    f"Errored when clearing '{pattern}' from cache: {error}"
+                )
 
-    async def clear_pattern(
-        self, pattern: str, condition: Optional[Callable[[Any], bool]] = None
+        await self._publish_invalidation(pattern=pattern)
+
+        return result
+
+    async def _clear_batch(
+        self,
+        keys: list[bytes],
+        measurement: Measurement,
+        condition: Optional[Callable[[Any], bool]] = None,
+    ) -> int:
+        if condition is not None:
+            values = await self._execute(self.client.mget(keys))
+            measurement.bytes_in += sum(len(value or b"") for value in values)
+            keys = [
+                key
+                for key, value in zip(keys, values)
+                if value is not None
+                and condition(measurement.serialise(self.codec.decode, value))
+            ]
+
+        if not keys:
+            return 0
+
+        pipeline = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.unlink(key)
+
+        return sum(await self._execute(pipeline.execute()))
+
+    def tag_key(self, tag: str) -> str:
+        return f"{self.tag_prefix}{tag}"
+
+    def invalidated_key(self, tag: str) -> str:
+        return f"{self.invalidated_prefix}{tag}"
+
+    def _add_tags(
+        self,
+        pipeline: Pipeline,
+        key: str,
+        tags: list[str],
+        expiry: Optional[int] = None,
     ) -> None:
-        key = self.alias_key(key=pattern)
-        if self.client is not None:
-            for key in await self.client.keys(pattern):
-                clear = (
-                    condition(await self.get(key=key))
-                    if condition is not None
-                    else True
+        for tag in tags:
+            tag_key = self.tag_key(tag=tag)
+            pipeline.sadd(tag_key, key)
+            # The tag set has to outlive every key it indexes, so only ever
+            # extend its expiry and drop it entirely for indefinite keys.
+            if expiry is None:
+                pipeline.persist(tag_key)
+            else:
+                pipeline.expire(tag_key, expiry, nx=True)
+                pipeline.expire(tag_key, expiry, gt=True)
+
+    async def invalidate_tags(self, tags: list[str]) -> int:
+        if not tags or not self.available():
+            return 0
+
+        tag_keys = [self.tag_key(tag=tag) for tag in tags]
+
+        with self.stats.measure(
+            operation="invalidate_tags", key=tag_keys[0]
+        ) as measurement:
+            try:
+                pipeline = self.client.pipeline(transaction=False)
+                for tag_key in tag_keys:
+                    pipeline.smembers(tag_key)
+                members = await self._execute(pipeline.execute())
+
+                keys = {key.decode() for tag_members in members for key in tag_members}
+
+                pipeline = self.client.pipeline(transaction=False)
+                for key in keys:
+                    pipeline.unlink(key)
+                for tag_key in tag_keys:
+                    pipeline.unlink(tag_key)
+                for tag in tags:
+                    pipeline.set(
+                        self.invalidated_key(tag=tag),
+                        1,
+                        px=int(self.invalidation_window * 1000),
+                    )
+                removed = await self._execute(pipeline.execute())
+
+                if self.local is not None:
+                    for key in keys:
+                        self.local.delete(key=key)
+                    await self._publish_invalidation(keys=[*keys])
+
+                return sum(removed[: len(keys)])
+            except Exception as error:
+                measurement.errors += 1
+                self.logger.error(
+                    f"Errored when invalidating tags {tags} in cache: {error}"
                 )
-                if clear:
-                    await self.clear(key=key)
+
+        return 0
+
+    # Invalidating a tag leaves a marker for the invalidation window, which
+    # should outlast the database replica lag, so that reads which would refill
+    # a cache entry know to go to the primary. Without the cache there is no way
+    # to tell, so everything counts as recently invalidated.
+    async def recently_invalidated(self, tag: str) -> bool:
+        if not self.available():
+            return True
+
+        try:
+            return bool(
+                await self._execute(self.client.exists(self.invalidated_key(tag=tag)))
+            )
+        except Exception as error:
+            self.logger.error(
+                f"Errored when checking '{tag}' invalidation in cache: {error}"
+            )
+            return True
+
+    async def single_flight[T](
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[T]],
+        lock_lease: Optional[float] = None,
+        fetch: Optional[Callable[[], Awaitable[T]]] = None,
+    ) -> T:
+        task = self.inflight.get(key)
+
+        # The computation runs in its own task that every caller awaits through
+        # a shield, so a cancelled caller (a client that disconnected, say)
+        # never cancels the others coalesced onto the same key.
+        if task is None:
+
+            async def run() -> T:
+                if lock_lease is not None:
+                    return await self._compute_with_lock(
+                        key=key, compute=compute, lock_lease=lock_lease, fetch=fetch
+                    )
+                return await compute()
+
+            task = asyncio.create_task(run())
+            self.inflight[key] = task
+            task.add_done_callback(lambda task: self._single_flown(key=key, task=task))
+
+        return await asyncio.shield(task)
+
+    def _single_flown(self, key: str, task: asyncio.Task) -> None:
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+
+        # Mark the exception as retrieved when every caller has gone away.
+        if not task.cancelled():
+            task.exception()
+
+    def revalidate(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        lock_lease: Optional[float] = None,
+        fetch: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> bool:
+        if key in self.inflight or key in self.revalidations:
+            return False
+
+        task = asyncio.create_task(
+            self.single_flight(
+                key=key, compute=compute, lock_lease=lock_lease, fetch=fetch
+            )
+        )
+        self.revalidations[key] = task
+        task.add_done_callback(lambda task: self._revalidated(key=key, task=task))
+
+        return True
+
+    def _revalidated(self, key: str, task: asyncio.Task) -> None:
+        self.revalidations.pop(key, None)
+
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error(
+                f"Errored when revalidating '{key}' in cache: {task.exception()}"
+            )
+
+    async def _compute_with_lock[T](
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[T]],
+        lock_lease: float,
+        fetch: Optional[Callable[[], Awaitable[T]]] = None,
+    ) -> T:
+        if not self.available():
+            return await compute()
+
+        lock = self.client.lock(f"{self.lock_prefix}{key}", timeout=lock_lease)
+
+        try:
+            acquired = await self._execute(lock.acquire(blocking=False))
+        except Exception as error:
+            self.logger.error(f"Errored when locking '{key}' in cache: {error}")
+            return await compute()
+
+        if acquired:
+            try:
+                return await compute()
+            finally:
+                try:
+                    await lock.release()
+                except Exception as error:
+                    self.logger.warning(
+                        f"Errored when unlocking '{key}' in cache: {error}"
+                    )
+
+        # Another worker holds the lease, so wait on its result for at most
+        # the lease before recomputing here.
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + lock_lease
+
+        while loop.time() < deadline:
+            await asyncio.sleep(self.lock_poll_interval)
+            if fetch is not None:
+                value = await fetch()
+            else:
+                value, _ = await self.get_with_ttl(key=key, default=MISSING)
+            if value is not MISSING:
+                return value
+
+        return await compute()
 
     def create_route_key(
         self,
@@ -155,13 +1202,33 @@ class Cache:
         include_query_params: bool = True,
         include_access_token: bool = False,
     ) -> str:
-        key = ""
-        key += request.url.hostname or ""
-        key += f":{request.url.port}" if request.url.port else ""
-        key += request.url.path
+        url = request.url
+        # Prefixes are memoised per route template rather than per concrete
+        # path, so id routes take one slot however many ids are requested.
+        path_format = getattr(request.scope.get("route"), "path_format", None)
+        path = (
+            request.scope.get("root_path", "") + path_format
+            if path_format is not None
+            else url.path
+        )
+        prefix = self.route_prefixes.get((url.netloc, path))
+
+        if prefix is None:
+            prefix = url.hostname or ""
+            prefix += f":{url.port}" if url.port else ""
+            prefix += path
+
+            if prefix.endswith("/"):
+                prefix = prefix[:-1]
+
+            if len(self.route_prefixes) >= self.route_prefix_cache_size:
+                self.route_prefixes.clear()
+            prefix = self.route_prefixes[(url.netloc, path)] = self.alias_key(
+                key=prefix
+            )
 
-        if key.endswith("/"):
-            key = key[:-1]
+        if path_format is not None and request.path_params:
+            prefix = prefix.format_map(request.path_params)
 
         search: list[str] = []
 
@@ -169,18 +1236,48 @@ class Cache:
             search.append(f"access_token={credentials.token}")
 
         if include_query_params:
-            for param, value in request.query_params.items():
-                if param != "access_token":
-                    search.append(f"{param}={value}")
+            search += [
+                f"{param}={value}"
+                for param, value in request.query_params.multi_items()
+                if param != "access_token"
+            ]
 
-        if search:
-            search.sort()
-            key += "?"
-            key += "&".join(search)
+        if not search:
+            return prefix
 
-        return self.alias_key(key=key)
+        search.sort()
+        query = "&".join(search)
 
-    def route(self, expiry: int = 60, include_access_token: bool = False) -> Any:
+        # Long queries and access tokens are hashed so keys stay a bounded size.
+        if (
+            self.route_query_hash_length is not None
+            and len(query) > self.route_query_hash_length
+        ):
+            query = "#" + hashlib.blake2b(query.encode(), digest_size=16).hexdigest()
+
+        return f"{prefix}?{query}"
+
+    def create_route_path(self, request: Request) -> str:
+        search = sorted(
+            (param, value)
+            for param, value in request.query_params.multi_items()
+            if param != "access_token"
+        )
+
+        return request.url.path + (f"?{urlencode(search)}" if search else "")
+
+    def route(
+        self,
+        expiry: int = 60,
+        include_access_token: bool = False,
+        tags: Optional[list[str]] = None,
+        value_tags: Optional[Callable[[Any], list[str]]] = None,
+        lock_lease: Optional[float] = None,
+        stale_ttl: Optional[int] = None,
+        raw: bool = False,
+        negative_expiry: Optional[int] = None,
+        bypass: Optional[Callable[[Request], bool]] = None,
+    ) -> Any:
         def decorator(func):
             signature = inspect.signature(func)
             has_request_param = False
@@ -222,7 +1319,7 @@ class Cache:
                 )
                 response = (
                     kwargs.get("response")
-                    if has_request_param
+                    if has_response_param
                     else kwargs.pop("response")
                 )
                 user_credentials = kwargs.get(
@@ -237,27 +1334,150 @@ class Cache:
                 if request.method != "GET":
                     self.logger.info("Non-get request not cached")
                     return await func(*args, **kwargs)
+                if bypass is not None and bypass(request):
+                    self.logger.info("Bypassed request not cached")
+                    return await func(*args, **kwargs)
 
                 response.headers["X-Will-Cache"] = "true"
                 response.headers["X-Cache-Duration"] = f"{expiry}"
+                if stale_ttl is not None:
+                    response.headers["X-Cache-Stale-Duration"] = f"{stale_ttl}"
                 key = self.create_route_key(
                     request=request,
                     credentials=user_credentials,
                     include_query_params=True,
                     include_access_token=include_access_token,
                 )
-                cached_value = await self.get(key=key)
 
-                if cached_value:
+                # Per-token entries can't be replayed when warming the cache.
+                if self.popularity is not None and not include_access_token:
+                    self.popularity.record(key=self.create_route_path(request=request))
+
+                async def fetch() -> Any:
+                    if raw:
+                        entry, _ = await self.get_entry_with_ttl(
+                            key=key, default=MISSING
+                        )
+                        return entry
+                    value, _ = await self.get_with_ttl(
+                        key=key, default=MISSING, primary=True
+                    )
+                    return value
+
+                async def compute() -> Any:
+                    route_tags = [tag.format(**kwargs) for tag in tags or []]
+
+                    try:
+                        value = await func(*args, **kwargs)
+                    except HTTPException as error:
+                        if negative_expiry is None or error.status_code != 404:
+                            raise
+
+                        # Remember the miss briefly so repeated lookups for
+                        # something that doesn't exist stop at the cache.
+                        value = NegativeEntry(
+                            status_code=error.status_code, detail=error.detail
+                        )
+                        if raw:
+                            return await self.set_entry(
+                                key=key,
+                                entry=value,
+                                expiry=negative_expiry,
+                                tags=route_tags,
+                            )
+                        return await self.set(
+                            key=key,
+                            value=value,
+                            expiry=negative_expiry,
+                            tags=route_tags,
+                        )
+
+                    if value_tags is not None:
+                        route_tags += value_tags(value)
+
+                    # Entries outlive their fresh window by the stale window so
+                    # they can still be served while being revalidated.
+                    if raw:
+                        body = await self.render_route_value(
+                            request=request, value=value
+                        )
+                        return await self.set_entry(
+                            key=key,
+                            entry=self.create_entry(body=body),
+                            expiry=expiry + (stale_ttl or 0),
+                            tags=route_tags,
+                        )
+
+                    if isinstance(value, BaseModel):
+                        value = dict(value)
+
+                    return await self.set(
+                        key=key,
+                        value=value,
+                        expiry=expiry + (stale_ttl or 0),
+                        tags=route_tags,
+                    )
+
+                def mark_hit(ttl: Optional[float], negative: bool = False) -> None:
                     response.headers["X-Cached-Value"] = "true"
-                    return cached_value
+                    response.headers["X-Cache-State"] = "fresh"
+
+                    if negative:
+                        response.headers["X-Cache-State"] = "negative"
+                    elif stale_ttl is not None and ttl is not None and ttl <= stale_ttl:
+                        response.headers["X-Cache-State"] = (
+                            "revalidating"
+                            if self.revalidate(
+                                key=key,
+                                compute=compute,
+                                lock_lease=lock_lease,
+                                fetch=fetch,
+                            )
+                            else "stale"
+                        )
+
+                # Conditional requests only need the stored etag, not the body.
+                if raw and request.headers.get("If-None-Match") is not None:
+                    etag, ttl = await self.get_entry_etag_with_ttl(key=key)
+
+                    if etag is not None and self.etag_matches(
+                        request=request, etag=etag
+                    ):
+                        mark_hit(ttl=ttl)
+                        return self.not_modified_response(
+                            response=response, etag=etag
+                        )
 
-                value = await func(*args, **kwargs)
+                if raw:
+                    cached_value, ttl = await self.get_entry_with_ttl(
+                        key=key, default=MISSING
+                    )
+                else:
+                    cached_value, ttl = await self.get_with_ttl(
+                        key=key, default=MISSING, primary=True
+                    )
 
-                if isinstance(value, BaseModel):
-                    value = dict(value)
+                if cached_value is not MISSING:
+                    mark_hit(
+                        ttl=ttl, negative=isinstance(cached_value, NegativeEntry)
+                    )
+                else:
+                    response.headers["X-Cache-State"] = "miss"
+                    cached_value = await self.single_flight(
+                        key=key, compute=compute, lock_lease=lock_lease, fetch=fetch
+                    )
 
-                return await self.set(key=key, value=value, expiry=expiry)
+                if isinstance(cached_value, NegativeEntry):
+                    raise HTTPException(
+                        status_code=cached_value.status_code,
+                        detail=cached_value.detail,
+                        headers=dict(response.headers),
+                    )
+                if raw:
+                    return self.entry_response(
+                        request=request, response=response, entry=cached_value
+                    )
+                return cached_value
 
             return wrapper
 
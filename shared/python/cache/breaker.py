@@ -0,0 +1,47 @@
+import time
+from typing import Optional
+
+
+class CircuitBreaker:
+    failure_threshold: int
+    reset_timeout: float
+    failures: int
+    opened_at: Optional[float]
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+
+        now = time.monotonic()
+
+        if now - self.opened_at < self.reset_timeout:
+            return False
+
+        # Let a single trial call through per reset window; its result either
+        # closes the breaker or keeps it open for another window.
+        self.opened_at = now
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> bool:
+        self.failures += 1
+
+        if self.failures >= self.failure_threshold:
+            opened = self.opened_at is None
+            self.opened_at = time.monotonic()
+            return opened
+
+        return False
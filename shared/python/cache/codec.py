@@ -0,0 +1,124 @@
+import zlib
+from typing import Any, NamedTuple, Optional
+
+from shared.python.json import serialise_json, parse_json, to_json_serialisable
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame as lz4
+except ImportError:
+    lz4 = None
+
+# Encoded values start with a format byte then a compression byte. Both sit
+# below 0x20 so they can never be mistaken for the first byte of the plain
+# JSON values written before the codec existed.
+FORMAT_JSON = 0x01
+FORMAT_MSGPACK = 0x02
+FORMAT_NEGATIVE = 0x03
+FORMATS = {"json": FORMAT_JSON, "msgpack": FORMAT_MSGPACK}
+
+COMPRESSION_NONE = 0x00
+COMPRESSION_ZLIB = 0x01
+COMPRESSION_LZ4 = 0x02
+COMPRESSIONS = {
+    None: COMPRESSION_NONE,
+    "zlib": COMPRESSION_ZLIB,
+    "lz4": COMPRESSION_LZ4,
+}
+
+
+# Stored in place of a value to remember that it does not exist.
+class NegativeEntry(NamedTuple):
+    status_code: int = 404
+    detail: Any = None
+
+
+class Codec:
+    format: int
+    compression: int
+    compression_threshold: int
+    compression_level: int
+
+    def __init__(
+        self,
+        format: str = "json",
+        compression: Optional[str] = None,
+        compression_threshold: int = 1024,
+        compression_level: int = 1,
+    ) -> None:
+        if format not in FORMATS:
+            raise ValueError(f"Unknown cache codec format: {format}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown cache codec compression: {compression}")
+        if format == "msgpack" and msgpack is None:
+            raise ImportError("msgpack is required for the msgpack cache codec")
+        if compression == "lz4" and lz4 is None:
+            raise ImportError("lz4 is required for lz4 cache compression")
+
+        self.format = FORMATS[format]
+        self.compression = COMPRESSIONS[compression]
+        self.compression_threshold = compression_threshold
+        self.compression_level = compression_level
+
+    def encode(self, value: Any) -> bytes:
+        if isinstance(value, NegativeEntry):
+            return (
+                bytes((FORMAT_NEGATIVE, COMPRESSION_NONE))
+                + serialise_json([value.status_code, value.detail]).encode()
+            )
+
+        if self.format == FORMAT_MSGPACK:
+            data = msgpack.packb(to_json_serialisable(value))
+        else:
+            data = serialise_json(value).encode()
+
+        compression = COMPRESSION_NONE
+
+        if self.compression != COMPRESSION_NONE and (
+            len(data) >= self.compression_threshold
+        ):
+            compression = self.compression
+            data = self.compress(data=data, compression=compression)
+
+        return bytes((self.format, compression)) + data
+
+    def decode(self, data: bytes) -> Any:
+        if not data or data[0] >= 0x20:
+            return parse_json(data)
+
+        format, compression = data[0], data[1]
+        data = self.decompress(data=data[2:], compression=compression)
+
+        if format == FORMAT_MSGPACK:
+            if msgpack is None:
+                raise ImportError("msgpack is required to read msgpack cache values")
+            return msgpack.unpackb(data)
+        if format == FORMAT_JSON:
+            return parse_json(data)
+        if format == FORMAT_NEGATIVE:
+            return NegativeEntry(*parse_json(data))
+
+        raise ValueError(f"Unknown cache value format: {format}")
+
+    def compress(self, data: bytes, compression: int) -> bytes:
+        if compression == COMPRESSION_ZLIB:
+            return zlib.compress(data, self.compression_level)
+        if compression == COMPRESSION_LZ4:
+            return lz4.compress(data, compression_level=self.compression_level)
+        return data
+
+    def decompress(self, data: bytes, compression: int) -> bytes:
+        if compression == COMPRESSION_ZLIB:
+            return zlib.decompress(data)
+        if compression == COMPRESSION_LZ4:
+            if lz4 is None:
+                raise ImportError("lz4 is required to read lz4 cache values")
+            return lz4.decompress(data)
+        if compression == COMPRESSION_NONE:
+            return data
+
+        raise ValueError(f"Unknown cache value compression: {compression}")
@@ -0,0 +1,100 @@
+import time
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from typing import Any, NamedTuple, Optional
+
+
+class LocalCacheEntry(NamedTuple):
+    value: Any
+    size: int
+    expires_at: Optional[float]
+    source_expires_at: Optional[float]
+
+
+class LocalCache:
+    max_entries: int
+    max_bytes: int
+    max_ttl: Optional[float]
+    size: int
+    entries: OrderedDict[str, LocalCacheEntry]
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 16 * 1024 * 1024,
+        max_ttl: Optional[float] = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_ttl = max_ttl
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        value, _ = self.get_with_ttl(key=key)
+        return value
+
+    def get_with_ttl(self, key: str) -> tuple[Optional[Any], Optional[float]]:
+        entry = self.entries.get(key)
+
+        if entry is None:
+            return None, None
+
+        now = time.monotonic()
+
+        if entry.expires_at is not None and entry.expires_at <= now:
+            self.delete(key=key)
+            return None, None
+
+        self.entries.move_to_end(key)
+        return (
+            entry.value,
+            (
+                entry.source_expires_at - now
+                if entry.source_expires_at is not None
+                else None
+            ),
+        )
+
+    def set(self, key: str, value: Any, size: int, ttl: Optional[float] = None) -> None:
+        self.delete(key=key)
+
+        if size > self.max_bytes:
+            return
+
+        now = time.monotonic()
+        source_expires_at = now + ttl if ttl is not None else None
+
+        if self.max_ttl is not None:
+            ttl = self.max_ttl if ttl is None else min(ttl, self.max_ttl)
+        if ttl is not None and ttl <= 0:
+            return
+
+        self.entries[key] = LocalCacheEntry(
+            value=value,
+            size=size,
+            expires_at=now + ttl if ttl is not None else None,
+            source_expires_at=source_expires_at,
+        )
+        self.size += size
+
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def delete(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+
+        if entry is not None:
+            self.size -= entry.size
+
+    def delete_pattern(self, pattern: str) -> None:
+        for key in [key for key in self.entries if fnmatchcase(key, pattern)]:
+            self.delete(key=key)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
@@ -0,0 +1,67 @@
+import hashlib
+import random
+
+
+class PopularitySketch:
+    width: int
+    depth: int
+    sample_rate: float
+    capacity: int
+    counters: list[list[int]]
+    candidates: dict[str, int]
+
+    def __init__(
+        self,
+        width: int = 2048,
+        depth: int = 4,
+        sample_rate: float = 0.1,
+        capacity: int = 256,
+    ) -> None:
+        self.width = width
+        self.depth = depth
+        self.sample_rate = sample_rate
+        self.capacity = capacity
+        self.reset()
+
+    def __len__(self) -> int:
+        return len(self.candidates)
+
+    def indexes(self, key: str) -> list[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=self.depth * 4).digest()
+
+        return [
+            int.from_bytes(digest[row * 4 : row * 4 + 4], "little") % self.width
+            for row in range(self.depth)
+        ]
+
+    def record(self, key: str) -> None:
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+
+        estimate = None
+        for row, index in enumerate(self.indexes(key=key)):
+            self.counters[row][index] += 1
+            count = self.counters[row][index]
+            estimate = count if estimate is None else min(estimate, count)
+
+        if key in self.candidates or len(self.candidates) < self.capacity:
+            self.candidates[key] = estimate
+            return
+
+        coldest = min(self.candidates, key=self.candidates.__getitem__)
+        if estimate > self.candidates[coldest]:
+            del self.candidates[coldest]
+            self.candidates[key] = estimate
+
+    def top(self, limit: int) -> list[tuple[str, float]]:
+        scale = 1 / self.sample_rate if self.sample_rate > 0 else 1
+
+        return sorted(
+            ((key, count * scale) for key, count in self.candidates.items()),
+            key=lambda candidate: candidate[1],
+            reverse=True,
+        )[:limit]
+
+    def reset(self) -> None:
+        self.counters = [[0] * self.width for _ in range(self.depth)]
+        self.candidates = {}
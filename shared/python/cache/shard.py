@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+from bisect import bisect
+from typing import Any, AsyncIterator, Callable, Optional, Self
+
+from redis.asyncio import Redis
+
+
+def decode_key(key: Any) -> str:
+    return key.decode() if isinstance(key, bytes) else str(key)
+
+
+class HashRing:
+    nodes: list[str]
+    points: list[int]
+    owners: list[str]
+
+    def __init__(self, nodes: list[str], replicas: int = 160) -> None:
+        self.nodes = nodes
+        ring = sorted(
+            (self.hash(f"{node}#{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self.points = [point for point, _ in ring]
+        self.owners = [node for _, node in ring]
+
+    @staticmethod
+    def hash(key: str) -> int:
+        return int.from_bytes(
+            hashlib.blake2b(key.encode(), digest_size=8).digest(), "big"
+        )
+
+    def node_for(self, key: str) -> str:
+        return self.owners[bisect(self.points, self.hash(key)) % len(self.points)]
+
+
+# Client-side sharding over several independent Redis nodes. Commands are
+# routed by their first key, so only the subset of the Redis API that Cache
+# uses needs special handling here.
+class ShardedRedis:
+    clients: dict[str, Redis]
+    ring: HashRing
+
+    def __init__(self, clients: dict[str, Redis], replicas: int = 160) -> None:
+        self.clients = clients
+        self.ring = HashRing(nodes=[*clients], replicas=replicas)
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        def command(key: Any, *args: Any, **kwargs: Any) -> Any:
+            return getattr(self.client_for(key), name)(key, *args, **kwargs)
+
+        return command
+
+    @property
+    def primary(self) -> Redis:
+        return self.clients[self.ring.nodes[0]]
+
+    def client_for(self, key: Any) -> Redis:
+        return self.clients[self.ring.node_for(decode_key(key))]
+
+    def pipeline(self, transaction: bool = True) -> "ShardedPipeline":
+        return ShardedPipeline(redis=self, transaction=transaction)
+
+    # Invalidation messages must reach every subscriber, so pub/sub always
+    # uses the first node rather than hashing the channel.
+    def pubsub(self, **kwargs: Any) -> Any:
+        return self.primary.pubsub(**kwargs)
+
+    async def publish(self, channel: str, message: Any) -> int:
+        return await self.primary.publish(channel, message)
+
+    async def mget(self, keys: list[Any]) -> list[Optional[bytes]]:
+        pipeline = self.pipeline(transaction=False)
+        pipeline.mget(keys)
+        [values] = await pipeline.execute()
+        return values
+
+    async def delete(self, *keys: Any) -> int:
+        pipeline = self.pipeline(transaction=False)
+        for key in keys:
+            pipeline.delete(key)
+        return sum(await pipeline.execute())
+
+    async def scan_iter(self, **kwargs: Any) -> AsyncIterator[bytes]:
+        for client in self.clients.values():
+            async for key in client.scan_iter(**kwargs):
+                yield key
+
+    async def ping(self) -> bool:
+        return all(
+            await asyncio.gather(*(client.ping() for client in self.clients.values()))
+        )
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(client.aclose() for client in self.clients.values()))
+
+
+class ShardedPipeline:
+    redis: ShardedRedis
+    transaction: bool
+    commands: list[tuple[str, tuple[Any, ...], dict[str, Any]]]
+
+    def __init__(self, redis: ShardedRedis, transaction: bool = True) -> None:
+        self.redis = redis
+        self.transaction = transaction
+        self.commands = []
+
+    def __getattr__(self, name: str) -> Callable[..., Self]:
+        def command(*args: Any, **kwargs: Any) -> Self:
+            self.commands.append((name, args, kwargs))
+            return self
+
+        return command
+
+    async def execute(self) -> list[Any]:
+        commands, self.commands = self.commands, []
+        pipelines: dict[str, Any] = {}
+        # Each command becomes one or more (node, index) parts so the node
+        # pipelines can run concurrently and their replies be put back in the
+        # order the commands were queued.
+        parts: list[list[tuple[str, int]]] = []
+
+        def queue(key: Any, name: str, *args: Any, **kwargs: Any) -> tuple[str, int]:
+            node = self.redis.ring.node_for(decode_key(key))
+            if node not in pipelines:
+                pipelines[node] = self.redis.clients[node].pipeline(
+                    transaction=self.transaction
+                )
+            getattr(pipelines[node], name)(key, *args, **kwargs)
+            return node, len(pipelines[node]) - 1
+
+        for name, args, kwargs in commands:
+            if name == "mget":
+                parts.append([queue(key, "get") for key in args[0]])
+            else:
+                parts.append([queue(args[0], name, *args[1:], **kwargs)])
+
+        nodes = [*pipelines]
+        replies = dict(
+            zip(
+                nodes,
+                await asyncio.gather(*(pipelines[node].execute() for node in nodes)),
+            )
+        )
+
+        return [
+            (
+                [replies[node][index] for node, index in command_parts]
+                if name == "mget"
+                else replies[command_parts[0][0]][command_parts[0][1]]
+            )
+            for (name, _, _), command_parts in zip(commands, parts)
+        ]
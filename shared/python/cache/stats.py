@@ -0,0 +1,213 @@
+import time
+from types import TracebackType
+from typing import Any, Callable, Optional, Self
+
+from shared.python.models.cache import CacheLatencyHistogram, CacheOperationStats
+
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    float("inf"),
+)
+
+
+class OperationStats:
+    hits: int
+    local_hits: int
+    negative_hits: int
+    misses: int
+    errors: int
+    bytes_in: int
+    bytes_out: int
+    serialise_seconds: float
+    latency_buckets: list[int]
+    latency_count: int
+    latency_sum: float
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.local_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.serialise_seconds = 0.0
+        self.latency_buckets = [0 for _ in LATENCY_BUCKETS]
+        self.latency_count = 0
+        self.latency_sum = 0.0
+
+
+class Measurement:
+    stats: "CacheStats"
+    operation: str
+    prefix: str
+    start: float
+    hits: int
+    local_hits: int
+    negative_hits: int
+    misses: int
+    errors: int
+    bytes_in: int
+    bytes_out: int
+    serialise_seconds: float
+
+    def __init__(self, stats: "CacheStats", operation: str, prefix: str) -> None:
+        self.stats = stats
+        self.operation = operation
+        self.prefix = prefix
+        self.start = 0.0
+        self.hits = 0
+        self.local_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.serialise_seconds = 0.0
+
+    def __enter__(self) -> Self:
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(
+        self,
+        exception_type: Optional[type[BaseException]],
+        exception: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if exception is not None:
+            self.errors += 1
+        self.stats.record(measurement=self, duration=time.perf_counter() - self.start)
+
+    def serialise[T](self, function: Callable[..., T], *args: Any) -> T:
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.serialise_seconds += time.perf_counter() - start
+
+
+class CacheStats:
+    operations: dict[tuple[str, str], OperationStats]
+    prefix_depth: int
+
+    def __init__(self, prefix_depth: int = 3) -> None:
+        self.operations = {}
+        self.prefix_depth = prefix_depth
+
+    def key_prefix(self, key: str) -> str:
+        key = key.split("?", 1)[0]
+
+        if "/" in key:
+            return "/".join(key.split("/")[: self.prefix_depth])
+        return key.split(":", 1)[0]
+
+    def measure(self, operation: str, key: str) -> Measurement:
+        return Measurement(stats=self, operation=operation, prefix=self.key_prefix(key))
+
+    def record(self, measurement: Measurement, duration: float) -> None:
+        stats = self.operations.get((measurement.operation, measurement.prefix))
+
+        if stats is None:
+            stats = OperationStats()
+            self.operations[(measurement.operation, measurement.prefix)] = stats
+
+        stats.hits += measurement.hits
+        stats.local_hits += measurement.local_hits
+        stats.negative_hits += measurement.negative_hits
+        stats.misses += measurement.misses
+        stats.errors += measurement.errors
+        stats.bytes_in += measurement.bytes_in
+        stats.bytes_out += measurement.bytes_out
+        stats.serialise_seconds += measurement.serialise_seconds
+        stats.latency_count += 1
+        stats.latency_sum += duration
+
+        for index, bucket in enumerate(LATENCY_BUCKETS):
+            if duration <= bucket:
+                stats.latency_buckets[index] += 1
+
+    def reset(self) -> None:
+        self.operations = {}
+
+    def snapshot(self) -> list[CacheOperationStats]:
+        return [
+            CacheOperationStats(
+                operation=operation,
+                prefix=prefix,
+                hits=stats.hits,
+                local_hits=stats.local_hits,
+                negative_hits=stats.negative_hits,
+                misses=stats.misses,
+                errors=stats.errors,
+                bytes_in=stats.bytes_in,
+                bytes_out=stats.bytes_out,
+                serialise_seconds=stats.serialise_seconds,
+                latency=CacheLatencyHistogram(
+                    buckets={
+                        ("+Inf" if bucket == float("inf") else str(bucket)): count
+                        for bucket, count in zip(LATENCY_BUCKETS, stats.latency_buckets)
+                    },
+                    count=stats.latency_count,
+                    sum=stats.latency_sum,
+                ),
+            )
+            for (operation, prefix), stats in sorted(self.operations.items())
+        ]
+
+    def to_prometheus(self, namespace: str = "cache") -> str:
+        counters = {
+            "hits": "Keys found in the cache.",
+            "local_hits": "Keys found in the in-process cache tier.",
+            "negative_hits": "Keys found cached as not existing.",
+            "misses": "Keys not found in the cache.",
+            "errors": "Cache operations that errored.",
+            "bytes_in": "Bytes read from the cache.",
+            "bytes_out": "Bytes written to the cache.",
+            "serialise_seconds": "Seconds spent encoding and decoding cache values.",
+        }
+        snapshot = self.snapshot()
+        lines: list[str] = []
+
+        for counter, description in counters.items():
+            lines.append(f"# HELP {namespace}_{counter}_total {description}")
+            lines.append(f"# TYPE {namespace}_{counter}_total counter")
+            for stats in snapshot:
+                lines.append(
+                    f"{namespace}_{counter}_total{{{prometheus_labels(stats)}}} "
+                    + f"{getattr(stats, counter)}"
+                )
+
+        histogram = f"{namespace}_operation_duration_seconds"
+        lines.append(f"# HELP {histogram} Latency of cache operations.")
+        lines.append(f"# TYPE {histogram} histogram")
+        for stats in snapshot:
+            labels = prometheus_labels(stats)
+            for bucket, count in stats.latency.buckets.items():
+                lines.append(f'{histogram}_bucket{{{labels},le="{bucket}"}} {count}')
+            lines.append(f"{histogram}_sum{{{labels}}} {stats.latency.sum}")
+            lines.append(f"{histogram}_count{{{labels}}} {stats.latency.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def prometheus_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_labels(stats: CacheOperationStats) -> str:
+    return (
+        f'operation="{prometheus_label_value(stats.operation)}",'
+        + f'prefix="{prometheus_label_value(stats.prefix)}"'
+    )
@@ -1,12 +1,37 @@
 import logging
-from typing import Optional, Self
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Self
 import asyncio
 import asyncpg
-from asyncpg import Connection, Pool
+from asyncpg import Connection, Pool, Record
 from fastapi import HTTPException
+from pydantic import BaseModel
 
+from shared.python.database.bulk import (
+    Rows,
+    chunked,
+    insert_query,
+    model_columns,
+    quote_identifier,
+    row_values,
+    upsert_query,
+)
+from shared.python.database.stats import PoolStats, QueryStats, to_prometheus
+from shared.python.models.database import DatabasePoolStats, DatabaseQueryStats
 from shared.python.speedyapi import Logger
 
+# Errors that mean the server or the connection to it is gone, rather than the
+# statement failing. Timeouts are OSErrors too but are left to the caller.
+CONNECTION_ERRORS = (
+    OSError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.AdminShutdownError,
+    asyncpg.CrashShutdownError,
+)
+
 
 class Database:
     user: str
@@ -14,7 +39,24 @@ class Database:
     host: str
     port: str
     name: Optional[str] = None
-    pool: Pool
+    min_size: int
+    max_size: int
+    max_queries: int
+    max_inactive_connection_lifetime: float
+    statement_cache_size: int
+    command_timeout: Optional[float]
+    connect_timeout: float
+    acquire_timeout: Optional[float]
+    server_settings: Optional[dict[str, str]]
+    init: Optional[Callable[[Connection], Awaitable[None]]]
+    stats: PoolStats
+    query_stats: QueryStats
+    slow_query_threshold: Optional[float]
+    explain_slow_queries: bool
+    pool: Optional[Pool]
+    replicas: list["Database"]
+    replica_tasks: list[asyncio.Task[None]]
+    in_rotation: bool
     logger: Logger
 
     def __init__(
@@ -25,6 +67,21 @@ class Database:
         port: str,
         name: Optional[str] = None,
         logger: Optional[Logger] = None,
+        min_size: int = 10,
+        max_size: int = 10,
+        max_queries: int = 50000,
+        max_inactive_connection_lifetime: float = 300,
+        statement_cache_size: int = 100,
+        command_timeout: Optional[float] = None,
+        connect_timeout: float = 60,
+        acquire_timeout: Optional[float] = None,
+        server_settings: Optional[dict[str, str]] = None,
+        init: Optional[Callable[[Connection], Awaitable[None]]] = None,
+        stats: Optional[PoolStats] = None,
+        replicas: Optional[list[str]] = None,
+        query_stats: Optional[QueryStats] = None,
+        slow_query_threshold: Optional[float] = None,
+        explain_slow_queries: bool = False,
     ) -> None:
         self.user = user
         self.password = password
@@ -32,32 +89,113 @@ class Database:
         self.port = port
         self.name = name
         self.logger = logger or logging.getLogger()
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_queries = max_queries
+        self.max_inactive_connection_lifetime = max_inactive_connection_lifetime
+        self.statement_cache_size = statement_cache_size
+        self.command_timeout = command_timeout
+        self.connect_timeout = connect_timeout
+        self.acquire_timeout = acquire_timeout
+        self.server_settings = server_settings
+        self.init = init
+        self.stats = stats or PoolStats()
+        self.query_stats = query_stats or QueryStats()
+        self.slow_query_threshold = slow_query_threshold
+        self.explain_slow_queries = explain_slow_queries
+        self.pool = None
+        self.replicas = [self._replica(address=address) for address in replicas or []]
+        self.replica_tasks = []
+        self.in_rotation = True
 
     def __call__(self) -> Self:
         return self
 
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    def _replica(self, address: str) -> "Database":
+        host, port = address.rsplit(":", 1)
+
+        return Database(
+            user=self.user,
+            password=self.password,
+            host=host,
+            port=port,
+            name=self.name,
+            logger=self.logger,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            max_queries=self.max_queries,
+            max_inactive_connection_lifetime=self.max_inactive_connection_lifetime,
+            statement_cache_size=self.statement_cache_size,
+            command_timeout=self.command_timeout,
+            connect_timeout=self.connect_timeout,
+            acquire_timeout=self.acquire_timeout,
+            server_settings=self.server_settings,
+            init=self.init,
+        )
+
+    # Reads sent to a replica go to a random connected one, falling back to the
+    # primary while none are up. A replica whose connection fails is taken out
+    # of rotation until it answers again.
+    @property
+    def reader(self) -> "Database":
+        replicas = [
+            replica
+            for replica in self.replicas
+            if replica.pool is not None and replica.in_rotation
+        ]
+        return random.choice(replicas) if replicas else self
+
+    def _remove_from_rotation(self, replica: "Database", error: Exception) -> None:
+        if not replica.in_rotation:
+            return
+
+        self.logger.error(
+            f"Errored when reading from replica {replica.address}, "
+            + f"using the primary until it reconnects: {error}"
+        )
+        replica.in_rotation = False
+        self.replica_tasks.append(asyncio.create_task(replica._reconnect()))
+
+    async def _reconnect(self) -> None:
+        while not self.in_rotation:
+            await asyncio.sleep(5)
+
+            try:
+                await self.pool.fetchval("SELECT 1", timeout=self.connect_timeout)
+            except Exception:
+                continue
+
+            self.in_rotation = True
+            self.logger.info(f"Replica {self.address} reconnected.")
+
     async def initialise(self) -> None:
         self.logger.info(
             f"Connecting to db at: postgresql://{self.host}:{self.port}, "
             + f"username: {self.user if self.user is not None else 'None'}"
         )
 
-        success = False
-
-        while not success:
+        while self.pool is None:
             try:
                 await self._initialise()
-                success = True
             except Exception as error:
                 self.logger.error(f"Failed to connect to db, retyring in 5s: {error}")
                 await asyncio.sleep(5)
-                await self.initialise()
 
         self.logger.info(
             f"Connected to db at:  postgresql://{self.host}:{self.port}, "
             + f"username: {self.user if self.user is not None else 'None'}"
         )
 
+        # Replicas connect in the background so one being down does not stop
+        # the service starting; reads use the primary until they are ready.
+        for replica in self.replicas:
+            replica.logger = self.logger
+            self.replica_tasks.append(asyncio.create_task(replica.initialise()))
+
     async def _initialise(self) -> None:
         self.pool = await asyncpg.create_pool(
             dsn=(
@@ -65,25 +203,355 @@ class Database:
                 + f"{self.user}:{self.password}@"
                 + f"{self.host}:{self.port}/"
                 + f"{self.name or ''}"
-            )
+            ),
+            min_size=self.min_size,
+            max_size=self.max_size,
+            max_queries=self.max_queries,
+            max_inactive_connection_lifetime=self.max_inactive_connection_lifetime,
+            statement_cache_size=self.statement_cache_size,
+            command_timeout=self.command_timeout,
+            timeout=self.connect_timeout,
+            server_settings=self.server_settings,
+            init=self._init_connection,
         )
 
+    async def _init_connection(self, connection: Connection) -> None:
+        pid = connection.get_server_pid()
+
+        def record_query(record: Any) -> None:
+            self.stats.record_query(pid=pid)
+
+        def close_connection(connection: Connection) -> None:
+            self.stats.close_connection(pid=pid)
+
+        self.stats.open_connection(pid=pid)
+        connection.add_query_logger(record_query)
+        connection.add_termination_listener(close_connection)
+
+        if self.init is not None:
+            await self.init(connection)
+
+    async def close(self) -> None:
+        for task in self.replica_tasks:
+            task.cancel()
+        self.replica_tasks = []
+
+        for replica in self.replicas:
+            await replica.close()
+
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def _acquire(self) -> Connection:
+        start = time.perf_counter()
+
+        try:
+            connection = await self.pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.stats.record_acquire_timeout()
+            raise
+
+        self.stats.record_acquire(duration=time.perf_counter() - start)
+        return connection
+
     def raise_database_http_error(self, error: Exception) -> None:
         if isinstance(error, asyncpg.ForeignKeyViolationError):
             raise HTTPException(status_code=400, detail=str(error))
         raise error
 
-    async def connection(self) -> Connection:
-        async with self.pool.acquire() as connection:
-            try:
-                yield connection
-            except Exception as error:
-                Database.raise_database_http_error(error=error)
+    @asynccontextmanager
+    async def acquire(self, replica: bool = False) -> AsyncIterator[Connection]:
+        database = self.reader if replica else self
+
+        async with self._connection(database=database) as connection:
+            yield connection
+
+    @asynccontextmanager
+    async def _connection(self, database: "Database") -> AsyncIterator[Connection]:
+        try:
+            connection = await database._acquire()
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="No database connection free.")
+
+        try:
+            yield connection
+        except Exception as error:
+            self.raise_database_http_error(error=error)
+        finally:
+            await database.pool.release(connection)
 
-    async def transaction(self) -> Connection:
-        async with self.pool.acquire() as connection:
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[Connection]:
+        async with self.acquire() as connection:
             async with connection.transaction():
+                yield connection
+
+    async def _measure[T](
+        self, query: str, command: Awaitable[T], rows: Callable[[T], int]
+    ) -> tuple[T, bool]:
+        start = time.perf_counter()
+
+        try:
+            result = await command
+        except Exception:
+            self.query_stats.record_error(query=query)
+            raise
+
+        duration = time.perf_counter() - start
+        slow = (
+            self.slow_query_threshold is not None
+            and duration >= self.slow_query_threshold
+        )
+        self.query_stats.record(
+            query=query, duration=duration, rows=rows(result), slow=slow
+        )
+
+        if slow:
+            self.logger.warning(
+                f"Slow query took {duration:.3f}s: {' '.join(query.split())}"
+            )
+
+        return result, slow
+
+    async def _run(
+        self, method: str, query: str, args: tuple[Any, ...], replica: bool
+    ) -> Any:
+        database = self.reader if replica else self
+
+        try:
+            return await self._run_on(
+                database=database, method=method, query=query, args=args
+            )
+        except CONNECTION_ERRORS as error:
+            if database is self or isinstance(error, TimeoutError):
+                raise
+            self._remove_from_rotation(replica=database, error=error)
+
+        return await self._run_on(database=self, method=method, query=query, args=args)
+
+    async def _run_on(
+        self, database: "Database", method: str, query: str, args: tuple[Any, ...]
+    ) -> Any:
+        async with self._connection(database=database) as connection:
+            result, slow = await self._measure(
+                query=query,
+                command=getattr(connection, method)(query, *args),
+                rows=lambda result: count_rows(method=method, result=result),
+            )
+
+            if slow and self.explain_slow_queries:
+                await self._explain(connection=connection, query=query, args=args)
+
+            return result
+
+    # EXPLAIN ANALYZE runs the statement again, so it is done in a transaction
+    # that is always rolled back to leave writes unapplied.
+    async def _explain(
+        self, connection: Connection, query: str, args: tuple[Any, ...]
+    ) -> None:
+        transaction = connection.transaction()
+        await transaction.start()
+
+        try:
+            rows = await connection.fetch(f"EXPLAIN (ANALYZE, BUFFERS) {query}", *args)
+            self.query_stats.record_plan(
+                query=query, plan="\n".join(row[0] for row in rows)
+            )
+        except Exception as error:
+            self.logger.error(f"Errored when explaining slow query: {error}")
+        finally:
+            await transaction.rollback()
+
+    async def fetch(
+        self, query: str, *args: Any, replica: bool = False
+    ) -> list[Record]:
+        return await self._run(method="fetch", query=query, args=args, replica=replica)
+
+    async def fetchrow(
+        self, query: str, *args: Any, replica: bool = False
+    ) -> Optional[Record]:
+        return await self._run(
+            method="fetchrow", query=query, args=args, replica=replica
+        )
+
+    async def fetchval(self, query: str, *args: Any, replica: bool = False) -> Any:
+        return await self._run(
+            method="fetchval", query=query, args=args, replica=replica
+        )
+
+    async def execute(self, query: str, *args: Any) -> str:
+        return await self._run(method="execute", query=query, args=args, replica=False)
+
+    # Rows are read through a server-side cursor `prefetch` at a time, so the
+    # connection is held until the caller finishes or closes the iterator. The
+    # recorded duration includes the caller's time between rows, so streamed
+    # statements are not checked against the slow query threshold. A replica
+    # failing before the first row falls back to the primary like other reads.
+    async def stream(
+        self, query: str, *args: Any, prefetch: int = 100, replica: bool = False
+    ) -> AsyncIterator[Record]:
+        database = self.reader if replica else self
+        streamed = False
+
+        try:
+            async for record in self._stream_on(
+                database=database, query=query, args=args, prefetch=prefetch
+            ):
+                streamed = True
+                yield record
+        except CONNECTION_ERRORS as error:
+            if database is self or streamed or isinstance(error, TimeoutError):
+                raise
+            self._remove_from_rotation(replica=database, error=error)
+        else:
+            return
+
+        async for record in self._stream_on(
+            database=self, query=query, args=args, prefetch=prefetch
+        ):
+            yield record
+
+    async def _stream_on(
+        self, database: "Database", query: str, args: tuple[Any, ...], prefetch: int
+    ) -> AsyncIterator[Record]:
+        async with self._connection(database=database) as connection:
+            async with connection.transaction(readonly=True):
+                start = time.perf_counter()
+                rows = 0
+
                 try:
-                    yield connection
-                except Exception as error:
-                    Database.raise_database_http_error(error=error)
+                    async for record in connection.cursor(
+                        query, *args, prefetch=prefetch
+                    ):
+                        rows += 1
+                        yield record
+                except Exception:
+                    self.query_stats.record_error(query=query)
+                    raise
+
+                self.query_stats.record(
+                    query=query,
+                    duration=time.perf_counter() - start,
+                    rows=rows,
+                    slow=False,
+                )
+
+    # The bulk writers take rows as models or dicts from an iterable or async
+    # iterator and write them `chunk_size` at a time inside one transaction, so
+    # only one chunk is held in memory. They return the number of rows written.
+    async def copy_records(
+        self,
+        table: str,
+        model: type[BaseModel],
+        rows: Rows,
+        columns: Optional[list[str]] = None,
+        exclude: Optional[set[str]] = None,
+        chunk_size: int = 1000,
+    ) -> int:
+        columns = columns or model_columns(model=model, exclude=exclude)
+        schema, _, name = table.rpartition(".")
+        query = (
+            f"COPY {quote_identifier(table)} "
+            + f"({', '.join(quote_identifier(column) for column in columns)}) "
+            + "FROM STDIN"
+        )
+        written = 0
+
+        async with self.transaction() as connection:
+            async for chunk in chunked(rows=rows, size=chunk_size):
+                await self._measure(
+                    query=query,
+                    command=connection.copy_records_to_table(
+                        name,
+                        records=[row_values(row=row, columns=columns) for row in chunk],
+                        columns=columns,
+                        schema_name=schema or None,
+                    ),
+                    rows=lambda _: len(chunk),
+                )
+                written += len(chunk)
+
+        return written
+
+    async def insert_many(
+        self,
+        table: str,
+        model: type[BaseModel],
+        rows: Rows,
+        columns: Optional[list[str]] = None,
+        exclude: Optional[set[str]] = None,
+        chunk_size: int = 1000,
+    ) -> int:
+        columns = columns or model_columns(model=model, exclude=exclude)
+        return await self._execute_many(
+            query=insert_query(table=table, columns=tuple(columns)),
+            columns=columns,
+            rows=rows,
+            chunk_size=chunk_size,
+        )
+
+    async def upsert_many(
+        self,
+        table: str,
+        model: type[BaseModel],
+        rows: Rows,
+        conflict: list[str],
+        columns: Optional[list[str]] = None,
+        exclude: Optional[set[str]] = None,
+        chunk_size: int = 1000,
+    ) -> int:
+        columns = columns or model_columns(model=model, exclude=exclude)
+        return await self._execute_many(
+            query=upsert_query(
+                table=table, columns=tuple(columns), conflict=tuple(conflict)
+            ),
+            columns=columns,
+            rows=rows,
+            chunk_size=chunk_size,
+        )
+
+    async def _execute_many(
+        self, query: str, columns: list[str], rows: Rows, chunk_size: int
+    ) -> int:
+        written = 0
+
+        async with self.transaction() as connection:
+            async for chunk in chunked(rows=rows, size=chunk_size):
+                await self._measure(
+                    query=query,
+                    command=connection.executemany(
+                        query, [row_values(row=row, columns=columns) for row in chunk]
+                    ),
+                    rows=lambda _: len(chunk),
+                )
+                written += len(chunk)
+
+        return written
+
+    def snapshot(self) -> list[DatabasePoolStats]:
+        return [
+            self.stats.snapshot(address=self.address, role="primary", pool=self.pool),
+            *(
+                replica.stats.snapshot(
+                    address=replica.address, role="replica", pool=replica.pool
+                )
+                for replica in self.replicas
+            ),
+        ]
+
+    def to_prometheus(self) -> str:
+        return to_prometheus(snapshots=self.snapshot())
+
+    def query_snapshot(self) -> list[DatabaseQueryStats]:
+        return self.query_stats.snapshot()
+
+
+def count_rows(method: str, result: Any) -> int:
+    if method == "fetch":
+        return len(result)
+    # execute returns a status tag such as "UPDATE 3" or "INSERT 0 1".
+    if method == "execute":
+        count = result.rsplit(" ", 1)[-1]
+        return int(count) if count.isdigit() else 0
+    return int(result is not None)
@@ -0,0 +1,70 @@
+from functools import lru_cache
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Optional, Union
+
+from pydantic import BaseModel
+
+Rows = Union[Iterable[Union[BaseModel, dict[str, Any]]], AsyncIterable[Any]]
+
+
+def quote_identifier(name: str) -> str:
+    return ".".join('"' + part.replace('"', '""') + '"' for part in name.split("."))
+
+
+def model_columns(
+    model: type[BaseModel], exclude: Optional[set[str]] = None
+) -> list[str]:
+    return [column for column in model.model_fields if column not in (exclude or ())]
+
+
+def row_values(
+    row: Union[BaseModel, dict[str, Any]], columns: list[str]
+) -> tuple[Any, ...]:
+    if isinstance(row, dict):
+        return tuple(row[column] for column in columns)
+    return tuple(getattr(row, column) for column in columns)
+
+
+@lru_cache(maxsize=256)
+def insert_query(table: str, columns: tuple[str, ...]) -> str:
+    return (
+        f"INSERT INTO {quote_identifier(table)} "
+        + f"({', '.join(quote_identifier(column) for column in columns)}) "
+        + f"VALUES ({', '.join(f'${index + 1}' for index in range(len(columns)))})"
+    )
+
+
+@lru_cache(maxsize=256)
+def upsert_query(
+    table: str, columns: tuple[str, ...], conflict: tuple[str, ...]
+) -> str:
+    updates = [
+        f"{quote_identifier(column)} = EXCLUDED.{quote_identifier(column)}"
+        for column in columns
+        if column not in conflict
+    ]
+
+    return (
+        insert_query(table=table, columns=columns)
+        + f" ON CONFLICT ({', '.join(quote_identifier(column) for column in conflict)}) "
+        + (f"DO UPDATE SET {', '.join(updates)}" if updates else "DO NOTHING")
+    )
+
+
+async def chunked(rows: Rows, size: int) -> AsyncIterator[list[Any]]:
+    chunk: list[Any] = []
+
+    if isinstance(rows, AsyncIterable):
+        async for row in rows:
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    else:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+
+    if chunk:
+        yield chunk
@@ -0,0 +1,61 @@
+import re
+from functools import lru_cache
+from typing import Any, NamedTuple, Optional, Union
+
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+class Query(NamedTuple):
+    sql: str
+    names: tuple[str, ...]
+
+    def arguments(self, **values: Any) -> list[Any]:
+        return [values[name] for name in self.names]
+
+
+# Templates keep their `{name}` placeholders. Each distinct name becomes one
+# positional `$n` parameter, so the compiled SQL is the same whatever the
+# values, and asyncpg's per-connection statement cache prepares it only once.
+# `fragments` are trusted SQL, like a WHERE clause built from fixed conditions,
+# and are substituted before the placeholders are compiled.
+@lru_cache(maxsize=1024)
+def _compile_query(template: str, fragments: tuple[tuple[str, str], ...]) -> Query:
+    for name, fragment in fragments:
+        template = template.replace(f"{{{name}}}", fragment)
+
+    names: list[str] = []
+
+    def parameter(match: re.Match[str]) -> str:
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return f"${names.index(match.group(1)) + 1}"
+
+    return Query(sql=PLACEHOLDER.sub(parameter, template), names=tuple(names))
+
+
+def compile_query(template: str, **fragments: str) -> Query:
+    return _compile_query(template, tuple(sorted(fragments.items())))
+
+
+def to_where(conditions: list[str]) -> str:
+    return " AND ".join(conditions) if conditions else "TRUE"
+
+
+def to_array[T](value: Optional[Union[T, list[T]]]) -> Optional[list[T]]:
+    if value is None or isinstance(value, list):
+        return value
+    return [value]
+
+
+class Keyset(NamedTuple):
+    sort_key: Any
+    id: int
+
+
+# Keyset pagination seeks past the last row of the previous page instead of
+# using OFFSET, so with an index on (column, id) every page costs the same.
+# Rows must be ordered by the same (column, id) pair.
+def to_keyset(column: str = "id") -> str:
+    if column == "id":
+        return "id > {after_id}"
+    return f"({column}, id) > ({{after_sort_key}}, {{after_id}})"
@@ -0,0 +1,250 @@
+from collections import deque
+from typing import Optional
+
+from asyncpg import Pool
+
+from shared.python.models.database import (
+    DatabaseConnectionStats,
+    DatabaseLatencyHistogram,
+    DatabasePoolStats,
+    DatabaseQueryStats,
+)
+
+ACQUIRE_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    float("inf"),
+)
+
+
+class PoolStats:
+    acquire_buckets: list[int]
+    acquire_count: int
+    acquire_sum: float
+    acquire_timeouts: int
+    connections_opened: int
+    connections_closed: int
+    queries: int
+    connection_queries: dict[int, int]
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def record_acquire(self, duration: float) -> None:
+        self.acquire_count += 1
+        self.acquire_sum += duration
+
+        for index, bucket in enumerate(ACQUIRE_BUCKETS):
+            if duration <= bucket:
+                self.acquire_buckets[index] += 1
+
+    def record_acquire_timeout(self) -> None:
+        self.acquire_timeouts += 1
+
+    def open_connection(self, pid: int) -> None:
+        self.connections_opened += 1
+        self.connection_queries[pid] = 0
+
+    def close_connection(self, pid: int) -> None:
+        self.connections_closed += 1
+        self.connection_queries.pop(pid, None)
+
+    def record_query(self, pid: int) -> None:
+        self.queries += 1
+        self.connection_queries[pid] = self.connection_queries.get(pid, 0) + 1
+
+    def reset(self) -> None:
+        self.acquire_buckets = [0 for _ in ACQUIRE_BUCKETS]
+        self.acquire_count = 0
+        self.acquire_sum = 0.0
+        self.acquire_timeouts = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.queries = 0
+        self.connection_queries = {}
+
+    def snapshot(
+        self, address: str, role: str, pool: Optional[Pool] = None
+    ) -> DatabasePoolStats:
+        size = pool.get_size() if pool is not None else 0
+        idle = pool.get_idle_size() if pool is not None else 0
+
+        return DatabasePoolStats(
+            address=address,
+            role=role,
+            size=size,
+            idle=idle,
+            in_use=size - idle,
+            min_size=pool.get_min_size() if pool is not None else 0,
+            max_size=pool.get_max_size() if pool is not None else 0,
+            connections_opened=self.connections_opened,
+            connections_closed=self.connections_closed,
+            acquire_timeouts=self.acquire_timeouts,
+            queries=self.queries,
+            acquire_wait=DatabaseLatencyHistogram(
+                buckets={
+                    ("+Inf" if bucket == float("inf") else str(bucket)): count
+                    for bucket, count in zip(ACQUIRE_BUCKETS, self.acquire_buckets)
+                },
+                count=self.acquire_count,
+                sum=self.acquire_sum,
+            ),
+            connections=[
+                DatabaseConnectionStats(pid=pid, queries=queries)
+                for pid, queries in sorted(self.connection_queries.items())
+            ],
+        )
+
+
+class StatementStats:
+    count: int
+    errors: int
+    rows: int
+    total_seconds: float
+    slow: int
+    durations: deque[float]
+    plan: Optional[str]
+
+    def __init__(self, sample_size: int) -> None:
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_seconds = 0.0
+        self.slow = 0
+        self.durations = deque(maxlen=sample_size)
+        self.plan = None
+
+    def percentile(self, durations: list[float], percentile: float) -> float:
+        if not durations:
+            return 0.0
+        return durations[min(len(durations) - 1, int(len(durations) * percentile))]
+
+
+# Statements are keyed by their SQL text, which for compiled queries is one per
+# template and WHERE shape. Percentiles cover the most recent `sample_size`
+# runs of each statement.
+class QueryStats:
+    sample_size: int
+    statements: dict[str, StatementStats]
+
+    def __init__(self, sample_size: int = 1024) -> None:
+        self.sample_size = sample_size
+        self.statements = {}
+
+    def statement(self, query: str) -> StatementStats:
+        stats = self.statements.get(query)
+
+        if stats is None:
+            stats = StatementStats(sample_size=self.sample_size)
+            self.statements[query] = stats
+
+        return stats
+
+    def record(self, query: str, duration: float, rows: int, slow: bool) -> None:
+        stats = self.statement(query=query)
+        stats.count += 1
+        stats.rows += rows
+        stats.total_seconds += duration
+        stats.slow += int(slow)
+        stats.durations.append(duration)
+
+    def record_error(self, query: str) -> None:
+        self.statement(query=query).errors += 1
+
+    def record_plan(self, query: str, plan: str) -> None:
+        self.statement(query=query).plan = plan
+
+    def reset(self) -> None:
+        self.statements = {}
+
+    def snapshot(self) -> list[DatabaseQueryStats]:
+        snapshots: list[DatabaseQueryStats] = []
+
+        for query, stats in self.statements.items():
+            durations = sorted(stats.durations)
+            snapshots.append(
+                DatabaseQueryStats(
+                    query=" ".join(query.split()),
+                    count=stats.count,
+                    errors=stats.errors,
+                    rows=stats.rows,
+                    total_seconds=stats.total_seconds,
+                    p50=stats.percentile(durations=durations, percentile=0.5),
+                    p95=stats.percentile(durations=durations, percentile=0.95),
+                    p99=stats.percentile(durations=durations, percentile=0.99),
+                    slow=stats.slow,
+                    plan=stats.plan,
+                )
+            )
+
+        return sorted(snapshots, key=lambda stats: stats.total_seconds, reverse=True)
+
+
+def to_prometheus(snapshots: list[DatabasePoolStats], namespace: str = "db") -> str:
+    lines: list[str] = []
+
+    gauges = {
+        "pool_size": "Open connections in the pool.",
+        "pool_idle": "Open connections not in use.",
+        "pool_in_use": "Connections currently acquired.",
+        "pool_min_size": "Minimum size of the pool.",
+        "pool_max_size": "Maximum size of the pool.",
+    }
+    for gauge, description in gauges.items():
+        lines.append(f"# HELP {namespace}_{gauge} {description}")
+        lines.append(f"# TYPE {namespace}_{gauge} gauge")
+        for snapshot in snapshots:
+            lines.append(
+                f"{namespace}_{gauge}{{{prometheus_labels(snapshot)}}} "
+                + f"{getattr(snapshot, gauge[5:])}"
+            )
+
+    counters = {
+        "connections_opened": "Connections opened by the pool.",
+        "connections_closed": "Connections closed by the pool.",
+        "acquire_timeouts": "Acquires that timed out waiting for a connection.",
+        "queries": "Queries run on the pool.",
+    }
+    for counter, description in counters.items():
+        lines.append(f"# HELP {namespace}_{counter}_total {description}")
+        lines.append(f"# TYPE {namespace}_{counter}_total counter")
+        for snapshot in snapshots:
+            lines.append(
+                f"{namespace}_{counter}_total{{{prometheus_labels(snapshot)}}} "
+                + f"{getattr(snapshot, counter)}"
+            )
+
+    connection_queries = f"{namespace}_connection_queries"
+    lines.append(f"# HELP {connection_queries} Queries run on each open connection.")
+    lines.append(f"# TYPE {connection_queries} gauge")
+    for snapshot in snapshots:
+        labels = prometheus_labels(snapshot)
+        for connection in snapshot.connections:
+            lines.append(
+                f'{connection_queries}{{{labels},pid="{connection.pid}"}} '
+                + f"{connection.queries}"
+            )
+
+    histogram = f"{namespace}_acquire_wait_seconds"
+    lines.append(f"# HELP {histogram} Seconds spent waiting for a connection.")
+    lines.append(f"# TYPE {histogram} histogram")
+    for snapshot in snapshots:
+        labels = prometheus_labels(snapshot)
+        for bucket, count in snapshot.acquire_wait.buckets.items():
+            lines.append(f'{histogram}_bucket{{{labels},le="{bucket}"}} {count}')
+        lines.append(f"{histogram}_sum{{{labels}}} {snapshot.acquire_wait.sum}")
+        lines.append(f"{histogram}_count{{{labels}}} {snapshot.acquire_wait.count}")
+
+    return "\n".join(lines) + "\n"
+
+
+def prometheus_labels(snapshot: DatabasePoolStats) -> str:
+    return f'address="{snapshot.address}",role="{snapshot.role}"'
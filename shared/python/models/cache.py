@@ -0,0 +1,34 @@
+from pydantic import BaseModel, Field
+
+
+class CacheLatencyHistogram(BaseModel):
+    buckets: dict[str, int] = Field(
+        description="Cumulative operation counts keyed by upper bound in seconds."
+    )
+    count: int = Field(description="The number of operations observed.")
+    sum: float = Field(description="The total seconds spent in the operations.")
+
+
+class CacheOperationStats(BaseModel):
+    operation: str = Field(description="The cache operation, e.g. get or set.")
+    prefix: str = Field(description="The key prefix the operations were grouped by.")
+    hits: int = Field(description="The number of keys found.")
+    local_hits: int = Field(description="The number of keys found in-process.")
+    negative_hits: int = Field(
+        description="The number of keys found cached as not existing."
+    )
+    misses: int = Field(description="The number of keys not found.")
+    errors: int = Field(description="The number of operations that errored.")
+    bytes_in: int = Field(description="The number of bytes read from the cache.")
+    bytes_out: int = Field(description="The number of bytes written to the cache.")
+    serialise_seconds: float = Field(
+        description="The total seconds spent encoding and decoding values."
+    )
+    latency: CacheLatencyHistogram = Field(
+        description="The latency histogram of the operations."
+    )
+
+
+class PopularCacheKey(BaseModel):
+    path: str = Field(description="The request path and query of a cached route.")
+    score: float = Field(description="The decayed estimate of requests for the path.")
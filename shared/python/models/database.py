@@ -0,0 +1,54 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class DatabaseLatencyHistogram(BaseModel):
+    buckets: dict[str, int] = Field(
+        description="Cumulative counts keyed by upper bound in seconds."
+    )
+    count: int = Field(description="The number of observations.")
+    sum: float = Field(description="The total seconds observed.")
+
+
+class DatabaseConnectionStats(BaseModel):
+    pid: int = Field(description="The backend process id of the connection.")
+    queries: int = Field(description="The number of queries run on the connection.")
+
+
+class DatabasePoolStats(BaseModel):
+    address: str = Field(description="The host and port the pool connects to.")
+    role: str = Field(description="Whether the pool is the primary or a replica.")
+    size: int = Field(description="The number of open connections in the pool.")
+    idle: int = Field(description="The number of open connections not in use.")
+    in_use: int = Field(description="The number of connections currently acquired.")
+    min_size: int = Field(description="The minimum size of the pool.")
+    max_size: int = Field(description="The maximum size of the pool.")
+    connections_opened: int = Field(description="The number of connections opened.")
+    connections_closed: int = Field(description="The number of connections closed.")
+    acquire_timeouts: int = Field(
+        description="The number of acquires that timed out waiting for a connection."
+    )
+    queries: int = Field(description="The number of queries run on the pool.")
+    acquire_wait: DatabaseLatencyHistogram = Field(
+        description="The histogram of seconds spent waiting to acquire a connection."
+    )
+    connections: list[DatabaseConnectionStats] = Field(
+        description="The open connections and the queries run on each."
+    )
+
+
+class DatabaseQueryStats(BaseModel):
+    query: str = Field(description="The statement template, whitespace collapsed.")
+    count: int = Field(description="The number of times the statement ran.")
+    errors: int = Field(description="The number of times the statement errored.")
+    rows: int = Field(description="The total rows returned or affected.")
+    total_seconds: float = Field(description="The total seconds spent running it.")
+    p50: float = Field(description="The median seconds over recent runs.")
+    p95: float = Field(description="The 95th percentile seconds over recent runs.")
+    p99: float = Field(description="The 99th percentile seconds over recent runs.")
+    slow: int = Field(description="The number of runs over the slow query threshold.")
+    plan: Optional[str] = Field(
+        description="The EXPLAIN (ANALYZE, BUFFERS) output of the last slow run.",
+        default=None,
+    )
@@ -0,0 +1,11 @@
+from typing import Generic, Optional, TypeVar
+from pydantic import BaseModel, Field
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    items: list[T] = Field(description="The items in this page.")
+    next: Optional[str] = Field(
+        description="The link to the next page, if there is one.", default=None
+    )
@@ -43,8 +43,12 @@ class RequestLoggerMiddleware(BaseHTTPMiddleware):
 
         cache = ""
 
+        cache_state = response.headers.get("X-Cache-State", "fresh")
+
         if response.headers.get("X-Cached-Value") == "true":
             cache = "[CACHE]"
+            if cache_state != "fresh":
+                cache = f"[CACHE - {cache_state.upper()}]"
         elif response.headers.get("X-Will-Cache") == "true":
             cache = f"[WILL CACHE - {response.headers.get('X-Cache-Duration', 'indefinite')}s]"
 
@@ -0,0 +1,60 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import Any, Callable, Optional
+from urllib.parse import urlencode
+
+from fastapi import HTTPException, Request
+
+from shared.python.database.query import Keyset
+from shared.python.json import parse_json, serialise_json
+from shared.python.models.pagination import Page
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(keyset: Keyset) -> str:
+    return (
+        urlsafe_b64encode(serialise_json([keyset.sort_key, keyset.id]).encode())
+        .decode()
+        .rstrip("=")
+    )
+
+
+def decode_cursor(
+    cursor: Optional[str], sort_type: Callable[[Any], Any] = int
+) -> Optional[Keyset]:
+    if cursor is None:
+        return None
+
+    try:
+        sort_key, id = parse_json(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return Keyset(sort_key=sort_type(sort_key), id=int(id))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+# Pages may be cached and served to other callers, so the link is built from
+# the sorted query params without the caller's access token, as the cache key is.
+def next_link(request: Request, cursor: str) -> str:
+    search = sorted(
+        (param, value)
+        for param, value in request.query_params.multi_items()
+        if param not in ("access_token", "cursor")
+    )
+    search.append(("cursor", cursor))
+    return f"{request.url.path}?{urlencode(search)}"
+
+
+# Stores are asked for one row more than the page size, so whether there is a
+# next page is known without a count.
+def to_page[T](
+    request: Request, items: list[T], limit: int, keyset: Callable[[T], Keyset]
+) -> Page[T]:
+    if len(items) <= limit:
+        return Page(items=items)
+
+    items = items[:limit]
+    return Page(
+        items=items,
+        next=next_link(request=request, cursor=encode_cursor(keyset(items[-1]))),
+    )
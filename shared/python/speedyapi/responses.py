@@ -0,0 +1,95 @@
+from typing import Any, AsyncIterable, AsyncIterator, Mapping, Optional
+
+from fastapi import Request
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from starlette.responses import StreamingResponse
+
+from shared.python.json import serialise_json
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Parses ?stream= with the same rules FastAPI applies to a bool query param.
+STREAM_FLAG = TypeAdapter(bool)
+
+
+def serialise(item: Any) -> bytes:
+    if isinstance(item, BaseModel):
+        return item.model_dump_json().encode()
+    return serialise_json(item, separators=(",", ":")).encode()
+
+
+# Writes items as they come from an async iterator, so a large listing is never
+# held in memory. Items are buffered up to `chunk_size` bytes per write.
+class StreamingJSONResponse(StreamingResponse):
+    media_type = "application/json"
+    prefix = b"["
+    separator = b","
+    terminator = b""
+    suffix = b"]"
+
+    def __init__(
+        self,
+        content: AsyncIterable[Any],
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        chunk_size: int = 65536,
+    ) -> None:
+        super().__init__(
+            content=self.encode(content=content, chunk_size=chunk_size),
+            status_code=status_code,
+            headers=headers,
+            media_type=self.media_type,
+        )
+
+    async def encode(
+        self, content: AsyncIterable[Any], chunk_size: int
+    ) -> AsyncIterator[bytes]:
+        buffer = bytearray(self.prefix)
+        first = True
+
+        try:
+            async for item in content:
+                if not first:
+                    buffer += self.separator
+                buffer += serialise(item) + self.terminator
+                first = False
+
+                if len(buffer) >= chunk_size:
+                    yield bytes(buffer)
+                    buffer.clear()
+        finally:
+            # Close the source early if the client goes away mid-stream so any
+            # database cursor it holds is released.
+            if hasattr(content, "aclose"):
+                await content.aclose()
+
+        buffer += self.suffix
+        if buffer:
+            yield bytes(buffer)
+
+
+class NDJSONResponse(StreamingJSONResponse):
+    media_type = NDJSON_MEDIA_TYPE
+    prefix = b""
+    separator = b""
+    terminator = b"\n"
+    suffix = b""
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("Accept", "")
+
+
+def wants_stream(request: Request) -> bool:
+    if wants_ndjson(request):
+        return True
+
+    try:
+        return STREAM_FLAG.validate_python(request.query_params.get("stream", False))
+    except ValidationError:
+        return False
+
+
+def stream_response(request: Request, content: AsyncIterable[Any]) -> StreamingResponse:
+    if wants_ndjson(request):
+        return NDJSONResponse(content=content)
+    return StreamingJSONResponse(content=content)
@@ -1,8 +1,15 @@
 from datetime import datetime
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 
+from shared.python.models.cache import CacheOperationStats, PopularCacheKey
+from shared.python.models.database import DatabasePoolStats, DatabaseQueryStats
+
 META_ROUTER = APIRouter()
+# Cache and database stats expose request paths, SQL and timings, so they are not
+# mounted by SpeedyAPI. Services include this router behind their own auth.
+META_STATS_ROUTER = APIRouter()
 
 
 class MetaResponse(BaseModel):
@@ -12,3 +19,71 @@ class MetaResponse(BaseModel):
 @META_ROUTER.get("/v0/meta", response_model=MetaResponse, tags=["default"])
 def meta() -> MetaResponse:
     return MetaResponse(timestamp=datetime.now())
+
+
+@META_STATS_ROUTER.get(
+    "/v0/meta/cache", response_model=list[CacheOperationStats], tags=["default"]
+)
+def cache_meta(request: Request) -> list[CacheOperationStats]:
+    cache = getattr(request.app, "cache", None)
+
+    if cache is None:
+        raise HTTPException(status_code=404, detail="No cache configured.")
+
+    return cache.stats.snapshot()
+
+
+@META_STATS_ROUTER.get(
+    "/v0/meta/cache/popular", response_model=list[PopularCacheKey], tags=["default"]
+)
+async def popular_cache_keys(
+    request: Request, limit: int = Query(default=100, ge=1, le=1000)
+) -> list[PopularCacheKey]:
+    cache = getattr(request.app, "cache", None)
+
+    if cache is None:
+        raise HTTPException(status_code=404, detail="No cache configured.")
+
+    return await cache.get_popular(limit=limit)
+
+
+@META_STATS_ROUTER.get(
+    "/v0/meta/database", response_model=list[DatabasePoolStats], tags=["default"]
+)
+def database_meta(request: Request) -> list[DatabasePoolStats]:
+    db = getattr(request.app, "db", None)
+
+    if db is None:
+        raise HTTPException(status_code=404, detail="No database configured.")
+
+    return db.snapshot()
+
+
+@META_STATS_ROUTER.get(
+    "/v0/meta/database/queries",
+    response_model=list[DatabaseQueryStats],
+    tags=["default"],
+)
+def database_queries_meta(request: Request) -> list[DatabaseQueryStats]:
+    db = getattr(request.app, "db", None)
+
+    if db is None:
+        raise HTTPException(status_code=404, detail="No database configured.")
+
+    return db.query_snapshot()
+
+
+@META_STATS_ROUTER.get(
+    "/v0/meta/metrics", response_class=PlainTextResponse, tags=["default"]
+)
+def metrics(request: Request) -> PlainTextResponse:
+    cache = getattr(request.app, "cache", None)
+    db = getattr(request.app, "db", None)
+    lines: list[str] = []
+
+    if cache is not None:
+        lines.append(cache.stats.to_prometheus())
+    if db is not None:
+        lines.append(db.to_prometheus())
+
+    return PlainTextResponse("".join(lines), media_type="text/plain; version=0.0.4")